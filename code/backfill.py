@@ -0,0 +1,343 @@
+"""
+backfill.py
+
+Parallel, resumable backfill of the yearly hourly CSVs (data/{prefix}_{year}.csv).
+
+Every (station, monitor, year) is split into month work units that run on the fetch engine's
+worker pool (fetch.py). Each finished unit is appended to a ledger with the binned rows of its
+month (data/cache/backfill/{prefix}_{year}.jsonl), so a failed request costs one station-month
+instead of a station-year, and an interrupted run resumes with the units still missing. Once
+all units of a year have run, the stations whose months are all done are added to the yearly
+CSV in one write, as the columns rain_1h / temp_1h / monitor_1h would produce for the year.
+The files written are rounded like the update scripts do once the run ends, in parallel
+(round_files). Stations that already have a column in the yearly CSV are skipped.
+
+Usage (from the repository root):
+    python code/backfill.py RH 2010 2025                 # monitor, first year, last year
+    python code/backfill.py Rain 1989 2025 --workers 16
+    python code/backfill.py TDmax 2010 2014 --stations 'AVNE ETAN' 'ZEMAH'
+    python code/backfill.py RH 2010 2025 --dry-run       # count the work units only (planner.py
+                                                         # lists and costs them)
+"""
+import os
+import json
+import time
+import argparse
+import functools
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from cache import _write_atomic
+from fetch import FetchEngine
+from journal import open_log
+from registry import station_registry
+from store import sync
+from weather import (file_prefix, query_unit, get_client, note_activity, hour_vector, add_rain_column,
+                     add_temp_column, add_mean_column, round_files)
+
+LEDGER_DIR = os.environ.get('IMS_BACKFILL_DIR', 'data/cache/backfill')
+
+
+def month_windows(year, today=None):
+    """
+    Month work windows of a year, the last one clipped to today.
+
+    Outputs:
+        list of (str, str, str): (month 'YYYY-MM', from_date, to_date) for each month that started.
+    """
+    today = today or datetime.now().strftime('%Y-%m-%d')
+    windows = []
+    for month in range(1, 13):
+        start = f'{year}-{month:02d}-01'
+        if start > today:
+            break
+        end = (datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).strftime('%Y-%m-%d')
+        windows.append((start[:7], start, min(end, today)))
+    return windows
+
+
+def year_hours(year):
+    """
+    Outputs:
+        list: Hourly axis of a yearly file, up to now for the current year (as in the collectors).
+    """
+    hours = hour_vector(f'{year}-01-01', f'{year}-12-31')
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M")
+    if hours[-1] > now_str:
+        hours = [h for h in hours if h <= now_str]
+    return hours
+
+
+class Ledger:
+    """
+    Append-only log of finished month units of one yearly file.
+
+    One JSON line per unit, rows counted from the start of the year:
+        {"station": "ZEMAH", "month": "2010-03", "rows": [1416, 1417], "values": [61.5, 60.17]}
+        {"station": "ZEMAH", "month": "2010-04", "rows": null, "values": null}   (no valid data)
+
+    Inputs:
+        prefix (str): File prefix, e.g. 'rh'.
+        year (int): Year of the file.
+    """
+    def __init__(self, prefix, year):
+        self.path = os.path.join(LEDGER_DIR, f'{prefix}_{year}.jsonl')
+        self.units = {}  # station -> {month: (rows, values) or None}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # line cut short by a crash
+                    rows = entry['rows']
+                    self.units.setdefault(entry['station'], {})[entry['month']] = \
+                        None if rows is None else (rows, entry['values'])
+        self.file = None
+
+    def done(self, station, month):
+        return month in self.units.get(station, {})
+
+    def add(self, station, month, rows, values):
+        """
+        Appends one unit, rows and values None if the month had no valid data.
+        """
+        if self.file is None:
+            self.file = open_log(self.path)
+        entry = {'station': station, 'month': month, 'rows': rows, 'values': values}
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+        self.units.setdefault(station, {})[month] = None if rows is None else (rows, values)
+
+    def drop(self, stations):
+        """
+        Removes stations that were written to the yearly file, the file is removed when empty.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        for station in stations:
+            self.units.pop(station, None)
+        if len(self.units) == 0:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        lines = [json.dumps({'station': station, 'month': month,
+                             'rows': None if unit is None else unit[0],
+                             'values': None if unit is None else unit[1]})
+                 for station, months in self.units.items() for month, unit in months.items()]
+        _write_atomic(self.path, ('\n'.join(lines) + '\n').encode('utf8'))
+
+
+def plan_year(monitor, year, stations, earliest, latest):
+    """
+    Month units of one year.
+
+    Inputs:
+        monitor (str): Monitor name, e.g. 'RH'.
+        year (int): Year.
+        stations (list): Station names to consider.
+        earliest, latest (dict): Station activity window from data/ims_activity.csv.
+
+    Outputs:
+        dict: station -> (channel name, list of (month, from_date, to_date)) for the stations the
+              yearly file still needs, with every month that overlaps the station's activity.
+    """
+    reg = station_registry()
+    prefix = file_prefix(monitor)
+    opcsv = f'data/{prefix}_{year}.csv'
+    columns = pd.read_csv(opcsv, nrows=0).columns if os.path.exists(opcsv) else []
+    windows = month_windows(year)
+    plan = {}
+    for station in stations:
+        name = monitor
+        if '_1m' in station:
+            if monitor != 'Rain' or year < 2017:
+                continue
+            name = 'Rain_1_min'
+        if station in columns or not reg.has(station, name) or station not in latest:
+            continue
+        months = windows
+        if year < 2026:  # don't skip stations active in 2026, as the collectors
+            months = [w for w in windows if not (w[1] > latest[station] or w[2] < earliest[station])]
+        if len(months) > 0:
+            plan[station] = (name, months)
+    return plan
+
+
+def bin_month(monitor, records, from_date, to_date):
+    """
+    Bins the records of one month unit like the collectors bin a whole year.
+
+    Outputs:
+        (numpy.ndarray, numpy.ndarray) or None: Rows within the month with a value and their
+                                                 values, None if there was no valid data.
+    """
+    df = pd.DataFrame({'datetime': hour_vector(from_date, to_date)})
+    if monitor == 'Rain':
+        added = add_rain_column(df, 'x', records)
+    elif monitor in ['TDmin', 'TDmax']:
+        added = add_temp_column(df, 'x', records, monitor)
+    else:
+        added = add_mean_column(df, 'x', records)
+    if not added:
+        return None
+    values = df['x'].values
+    rows = np.flatnonzero(~np.isnan(values))
+    return rows, values[rows]
+
+
+def write_complete_stations(monitor, year, plan, ledger, written=None):
+    """
+    Adds the stations whose months are all in the ledger to the yearly CSV.
+
+    Inputs:
+        written (set): The CSV's path is added to it if the CSV was written.
+
+    Outputs:
+        list: Stations complete in the ledger, written unless they had no valid data.
+    """
+    prefix = file_prefix(monitor)
+    opcsv = f'data/{prefix}_{year}.csv'
+    complete = [station for station, (_, months) in plan.items()
+                if all(ledger.done(station, month) for month, _, _ in months)]
+    if len(complete) == 0:
+        return []
+    if os.path.exists(opcsv):
+        df = pd.read_csv(opcsv)
+    else:
+        df = pd.DataFrame({'datetime': year_hours(year)})
+    start = np.datetime64(f'{year}-01-01T00', 'h')
+    added = []
+    for station in complete:
+        units = [ledger.units[station][month] for month, _, _ in plan[station][1]]
+        if all(unit is None for unit in units):
+            continue  # no valid data in the whole year, the collectors add no column either
+        column = np.full(len(df), np.nan)
+        for (month, _, _), unit in zip(plan[station][1], units):
+            if unit is None:
+                continue
+            offset = int((np.datetime64(f'{month}-01T00', 'h') - start).astype(int))
+            rows = np.array(unit[0], dtype=int) + offset
+            keep = rows < len(df)
+            column[rows[keep]] = np.array(unit[1], dtype=float)[keep]
+        df[station] = column
+        added.append(station)
+    if len(added) > 0:
+        df.to_csv(opcsv, index=False)
+        if written is not None:
+            written.add(opcsv)
+    return complete
+
+
+def plan_backfill(monitor, from_year, to_year, stations=None):
+    """
+    Month units a backfill of one monitor still has to fetch, without fetching anything.
+
+    Inputs:
+        monitor, from_year, to_year, stations: As in backfill.
+
+    Outputs:
+        (dict, dict, list): year -> plan_year's plan, year -> its Ledger, and the units to fetch
+                            as (year, station, channel, month, from_date, to_date).
+    """
+    reg = station_registry()
+    stations = list(reg.ids) if stations is None else stations
+    df_activity = pd.read_csv('data/ims_activity.csv')
+    earliest = dict(zip(df_activity['name'], df_activity['earliest'].fillna('')))
+    latest = dict(zip(df_activity['name'], df_activity['latest'].fillna('')))
+    prefix = file_prefix(monitor)
+    plans, ledgers, units = {}, {}, []
+    for year in range(from_year, to_year + 1):
+        plans[year] = plan_year(monitor, year, stations, earliest, latest)
+        ledgers[year] = Ledger(prefix, year)
+        units.extend((year, station, channel, month, from_date, to_date)
+                     for station, (channel, months) in plans[year].items()
+                     for month, from_date, to_date in months if not ledgers[year].done(station, month))
+    return plans, ledgers, units
+
+
+def backfill(monitor, from_year, to_year, stations=None, workers=None, dry_run=False):
+    """
+    Backfills the yearly files of one monitor.
+
+    Inputs:
+        monitor (str): 'Rain', 'TDmin', 'TDmax' or any averaged monitor ('RH', 'Grad', 'WS', ...).
+        from_year, to_year (int): Years to backfill, inclusive.
+        stations (list or None): Station names. None means all stations.
+        workers (int): Requests in flight. Default is None (IMS_CONCURRENCY or 8).
+        dry_run (bool): Only print the number of units per year.
+
+    Outputs:
+        dict: year -> number of stations completed.
+    """
+    prefix = file_prefix(monitor)
+    plans, ledgers, units = plan_backfill(monitor, from_year, to_year, stations)
+    for year in plans:
+        todo = sum(unit[0] == year for unit in units)
+        print(f'{prefix} {year}: {len(plans[year])} stations, {todo} month units to fetch')
+    if dry_run:
+        return {}
+    remaining = {year: 0 for year in plans}
+    for unit in units:
+        remaining[unit[0]] += 1
+    written = {}
+    files = set()
+    for year in plans:  # nothing left to fetch, e.g. interrupted after the last unit
+        if remaining[year] == 0:
+            done = write_complete_stations(monitor, year, plans[year], ledgers[year], files)
+            ledgers[year].drop(done)
+            written[year] = len(done)
+    calls = [{'station': station, 'channel': channel, 'from_date': from_date, 'to_date': to_date}
+             for _, station, channel, _, from_date, to_date in units]
+    failed = 0
+    seen = {}
+    t0 = time.time()
+    with FetchEngine(concurrency=workers) as engine:
+        for count, (unit, (call, records)) in enumerate(zip(units, engine.map(functools.partial(query_unit, monitor), calls))):
+            year, station, _, month, from_date, to_date = unit
+            remaining[year] -= 1
+            if records is None:
+                failed += 1  # not in the ledger, the next run fetches it again
+            else:
+                seen[station] = max(records.last or '', seen.get(station, ''))
+                binned = bin_month(monitor, records, from_date, to_date)
+                if binned is None:
+                    ledgers[year].add(station, month, None, None)
+                else:
+                    ledgers[year].add(station, month, binned[0].tolist(), binned[1].tolist())
+            msg = f'{prefix} {station} {month} ({count + 1}/{len(units)}, {time.time() - t0:.0f}s, {failed} failed)'
+            print(f'\r{msg:<80}', end='', flush=True)
+            if remaining[year] == 0:
+                done = write_complete_stations(monitor, year, plans[year], ledgers[year], files)
+                ledgers[year].drop(done)
+                written[year] = len(done)
+    print()
+    if files:
+        print(f'rounding {len(files)} files')
+        round_files(sorted(files))
+        for opcsv in files:
+            sync(opcsv)
+    note_activity(seen)
+    if failed:
+        print(f'{failed} month units failed, run again to fetch them')
+    get_client().costs.save()
+    print(f'IMS API: {get_client().report()}')
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill yearly hourly files month by month, resumable.')
+    parser.add_argument('monitor', help="monitor name, e.g. Rain, TDmin, TDmax, RH, Grad, WS, WD")
+    parser.add_argument('from_year', type=int)
+    parser.add_argument('to_year', type=int)
+    parser.add_argument('--stations', nargs='+', default=None, help='station names, default all')
+    parser.add_argument('--workers', type=int, default=None, help='requests in flight (IMS_CONCURRENCY or 8)')
+    parser.add_argument('--dry-run', action='store_true', help='count the work units only')
+    args = parser.parse_args()
+    backfill(args.monitor, args.from_year, args.to_year, stations=args.stations, workers=args.workers,
+             dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
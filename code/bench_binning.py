@@ -0,0 +1,97 @@
+"""
+bench_binning.py
+
+Time to bin one station's records into an hourly column, per collector, comparing the
+previous per-record loop (a row search over the whole frame for every record) with the
+vectorized helpers in weather.py. Both must produce the same CSV.
+
+Usage (from the repository root):
+    python code/bench_binning.py           # one station-month of 10 minute records
+    python code/bench_binning.py 90 1      # days, minutes between records
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+import weather
+
+
+def loop_rain(df_rain, station, data):
+    data = [d for d in data if d['channels'][0]['value'] > 0]
+    data = [d for d in data if d['channels'][0]['valid'] == True and d['channels'][0]['status'] == 1]
+    df_rain[station] = np.nan
+    for d in data:
+        row = np.where(df_rain['datetime'].values == d['datetime'][:13].replace('T', ' ') + ':00')[0][0]
+        value = np.round(d['channels'][0]['value'], 1)
+        df_rain.at[row, station] = np.nansum([df_rain.at[row, station], value])
+    return True
+
+
+def loop_temp(df_temp, station, data, monitor):
+    data = [d for d in data if d['channels'][0]['valid'] == True and d['channels'][0]['status'] == 1]
+    df_temp[station] = np.nan
+    for d in data:
+        row_idx = np.where(df_temp['datetime'].values == d['datetime'][:13].replace('T', ' ') + ':00')[0]
+        if len(row_idx) == 0:
+            continue
+        row = row_idx[0]
+        value = np.round(d['channels'][0]['value'], 1)
+        current = df_temp.at[row, station]
+        if np.isnan(current) or (monitor == 'TDmin' and value < current) or (monitor == 'TDmax' and value > current):
+            df_temp.at[row, station] = value
+    return True
+
+
+def loop_mean(df_out, station, data):
+    data = [d for d in data if d['channels'][0]['valid'] == True and d['channels'][0]['status'] == 1]
+    df_out[station] = np.nan
+    hour_vals = {}
+    for d in data:
+        hour_vals.setdefault(d['datetime'][:13].replace('T', ' ') + ':00', []).append(d['channels'][0]['value'])
+    for date_time, vals in hour_vals.items():
+        row_idx = np.where(df_out['datetime'].values == date_time)[0]
+        if len(row_idx) == 0:
+            continue
+        df_out.at[row_idx[0], station] = np.round(np.mean(vals), 2)
+    return True
+
+
+def synthetic(days, step, kind, rng):
+    minutes = np.arange(0, days * 1440, step)
+    stamps = np.datetime64('2025-01-01T00:00') + minutes.astype('timedelta64[m]')
+    if kind == 'rain':
+        values = np.where(rng.random(len(minutes)) < 0.1, np.round(rng.random(len(minutes)) * 3, 1), 0.0)
+    else:
+        values = np.round(rng.normal(20, 5, len(minutes)), 1)
+    status = np.where(rng.random(len(minutes)) < 0.01, 2, 1)
+    return [{'datetime': str(t) + ':00+02:00', 'channels': [{'value': v, 'valid': True, 'status': s}]}
+            for t, v, s in zip(stamps, values.tolist(), status.tolist())]
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 31
+    step = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    rng = np.random.default_rng(0)
+    to_date = (np.datetime64('2025-01-01') + np.timedelta64(days - 1, 'D')).astype(str)
+    hours = weather.hour_vector('2025-01-01', to_date)
+    cases = [('rain', loop_rain, weather.add_rain_column, ()),
+             ('TDmin', loop_temp, weather.add_temp_column, ('TDmin',)),
+             ('TDmax', loop_temp, weather.add_temp_column, ('TDmax',)),
+             ('mean', loop_mean, weather.add_mean_column, ())]
+    print(f'{days} days of {step} minute records, {len(hours)} hours')
+    for name, before, after, args in cases:
+        data = synthetic(days, step, 'rain' if name == 'rain' else 'temp', rng)
+        df_before = pd.DataFrame({'datetime': hours})
+        df_after = pd.DataFrame({'datetime': hours})
+        t0 = time.time()
+        before(df_before, 'S', data, *args)
+        t1 = time.time()
+        after(df_after, 'S', data, *args)
+        t2 = time.time()
+        same = df_before.to_csv() == df_after.to_csv()
+        print(f'{name:>5}: loop {t1 - t0:7.3f} s  vectorized {t2 - t1:6.3f} s  '
+              f'speedup {(t1 - t0) / max(t2 - t1, 1e-6):7.1f}x  identical {same}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+bench_decode.py
+
+Peak memory and time of decoding one data response, whole body (json.loads, as get_json does)
+against the streaming RecordDecoder (records.py) fed in 64 KiB chunks, for a year of one
+channel and a quarter of an all-channels response. Payloads come from the local stand-in
+(ims_fake.py), so the data directory must be present.
+
+The whole-body figure includes the body itself, which requests keeps in memory until decoding
+is done; the streaming path never holds more than one chunk of it.
+
+Usage (from the repository root):
+    python code/bench_decode.py
+    python code/bench_decode.py 'AVNE ETAN' 2024
+"""
+import sys
+import json
+import time
+import tracemalloc
+from datetime import datetime
+from ims_fake import FakeIMS
+from records import RecordDecoder, loads
+from registry import station_registry
+from weather_data import valid_values, split_channels
+
+
+def whole(body, channels):
+    data = json.loads(body)['data']
+    if channels:
+        return {name: valid_values(split_channels(data, name)) for name in channels}
+    return valid_values(data)
+
+
+def streamed(body, channels, chunk_size=1 << 16):
+    decoder = RecordDecoder(channels)
+    for start in range(0, len(body), chunk_size):
+        decoder.feed(body[start:start + chunk_size])
+    records = decoder.close()
+    if channels:
+        return {name: valid_values(records[name]) for name in channels}
+    return valid_values(records)
+
+
+def measure(func, body, channels):
+    tracemalloc.start()
+    t0 = time.time()
+    result = func(body, channels)
+    elapsed = time.time() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def same(a, b):
+    if isinstance(a, dict):
+        return all(same(a[k], b[k]) for k in a)
+    return all((x == y).all() for x, y in zip(a, b))
+
+
+def main():
+    station = sys.argv[1] if len(sys.argv) > 1 else 'AVNE ETAN'
+    year = int(sys.argv[2]) if len(sys.argv) > 2 else 2025
+    reg = station_registry()
+    fake = FakeIMS()
+    stationid = reg.ids[station]
+    cases = [(f'{year} TDmax', reg.channel(station, 'TDmax'), datetime(year, 1, 1), datetime(year + 1, 1, 1), None),
+             (f'{year} Q1 all channels', None, datetime(year, 1, 1), datetime(year, 4, 1), ['Rain', 'TDmax', 'RH'])]
+    print(f'backend for record batches: {loads.__module__}')
+    for label, channel, start, end, channels in cases:
+        body = json.dumps({'stationId': stationid, 'data': fake.records(stationid, channel, start, end)}).encode('utf8')
+        full, t_full, peak_full = measure(whole, body, channels)
+        part, t_stream, peak_stream = measure(streamed, body, channels)
+        print(f'{station} {label}: body {len(body) / 2**20:6.1f} MB')
+        print(f'    whole body: {t_full:5.2f} s  peak {(peak_full + len(body)) / 2**20:7.1f} MB')
+        print(f'    streamed:   {t_stream:5.2f} s  peak {peak_stream / 2**20:7.1f} MB  identical {same(full, part)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+bench_fetch.py
+
+Wall-clock scaling of the fetch engine (fetch.py) at 1/4/16/32 requests in flight,
+running weather.query_rain against the local IMS stand-in (ims_fake.py).
+
+Usage (from the repository root):
+    python code/bench_fetch.py                 # 64 station-month requests, 200 ms latency
+    python code/bench_fetch.py 128 0.5 0.1     # requests, latency in seconds, error.png rate
+"""
+import os
+import sys
+import time
+from ims_fake import start_process
+
+
+def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    error_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    server, url = start_process(port=8766, latency=latency, error_rate=error_rate)
+    os.environ['IMS_API_URL'] = url
+    os.environ['IMS_CACHE'] = '0'
+    os.environ['IMS_SHARED_RATE'] = '0'  # measure the engine alone, see bench_ratelimit.py for the limiter
+    import weather
+    from fetch import FetchEngine
+    from registry import station_registry
+
+    reg = station_registry()
+    names = [name for name in reg.ids if reg.has(name, 'Rain')]
+    calls = [{'station': names[ii % len(names)], 'from_date': '2025-01-01', 'to_date': '2025-01-31'}
+             for ii in range(n_requests)]
+    print(f'{n_requests} requests, {latency*1000:.0f} ms latency, {error_rate:.0%} error.png')
+    # warm-up: the stand-in keeps generated payloads, so every timed run sees the same server cost
+    with FetchEngine(concurrency=8) as engine:
+        list(engine.map(weather.query_rain, calls))
+    base_time = None
+    for concurrency in [1, 4, 16, 32]:
+        t0 = time.time()
+        with FetchEngine(concurrency=concurrency) as engine:
+            results = [data for _, data in engine.map(weather.query_rain, calls)]
+        elapsed = time.time() - t0
+        failed = sum(r is None for r in results)
+        base_time = base_time or elapsed
+        print(f'concurrency {concurrency:>2}: {elapsed:6.2f} s  speedup {base_time / elapsed:5.1f}x  failed {failed}')
+    print(f'IMS API: {weather.client.report()}')
+    server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+bench_import.py
+
+Import time of the code modules, each in a fresh interpreter started in an empty directory
+without IMS_API_TOKEN, so an import that reads data files, needs the token or leaves files
+behind fails here. Exits with status 1 if a module breaks its time budget or has side effects.
+
+Usage (from the repository root):
+    python code/bench_import.py          # 5 runs per module
+    python code/bench_import.py 20
+"""
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import numpy as np
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# module -> (seconds budget for the median import, modules it must not pull in)
+BUDGETS = {
+    'weather_data': (0.3, ['pandas', 'requests']),
+    'registry': (0.1, ['pandas', 'requests', 'numpy']),
+    'weather': (1.5, []),
+}
+
+PROBE = '''
+import sys, time, json
+sys.path.insert(0, {code_dir!r})
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{'seconds': elapsed, 'modules': sorted(sys.modules)}}))
+'''
+
+
+def measure(module, runs):
+    env = {k: v for k, v in os.environ.items() if k != 'IMS_API_TOKEN'}
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    times = []
+    loaded = set()
+    with tempfile.TemporaryDirectory() as cwd:
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, '-c', PROBE.format(code_dir=CODE_DIR, module=module)],
+                                 cwd=cwd, env=env, capture_output=True, text=True)
+            if out.returncode != 0:
+                return None, set(), out.stderr.strip().splitlines()[-1]
+            result = json.loads(out.stdout)
+            times.append(result['seconds'])
+            loaded.update(result['modules'])
+        leftovers = os.listdir(cwd)
+    return float(np.median(times)), loaded, f'created {leftovers}' if leftovers else ''
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    failed = False
+    for module, (budget, forbidden) in BUDGETS.items():
+        seconds, loaded, error = measure(module, runs)
+        pulled = [m for m in forbidden if m in loaded]
+        if seconds is None:
+            status = f'FAIL import error: {error}'
+        elif error:
+            status = f'FAIL {error}'
+        elif pulled:
+            status = f'FAIL imports {pulled}'
+        elif seconds > budget:
+            status = f'FAIL over budget {budget:.2f} s'
+        else:
+            status = 'ok'
+        failed |= status != 'ok'
+        time_str = f'{seconds * 1000:7.1f} ms' if seconds is not None else '      - ms'
+        print(f'{module:<14} {time_str}  (budget {budget * 1000:.0f} ms)  {status}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
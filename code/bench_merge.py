@@ -0,0 +1,82 @@
+"""
+bench_merge.py
+
+Time to merge a late-December update into a full year, comparing the previous per-cell loops
+of the update scripts (rain_update.py, and temp_update.py / monitor_update.py) with the bulk
+merge they now share (weather.upsert). Both must produce the same frame.
+
+The year is cut a few days before its end and every station gets the last days again, some
+values revised, as a daily update late in the year does.
+
+Usage (from the repository root):
+    python code/bench_merge.py                          # data/temp_max_2025.csv, 4 days
+    python code/bench_merge.py data/rain_2025.csv 10    # file, days to update
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from weather import upsert
+
+
+def loop_rain(df_rain, df_rain_new, stations):
+    if df_rain_new['datetime'].iloc[-1] > df_rain['datetime'].iloc[-1]:
+        istart = np.where(df_rain_new['datetime'] == df_rain['datetime'].iloc[-1])[0][0] + 1
+        for irow in range(istart, len(df_rain_new)):
+            df_rain.at[len(df_rain), 'datetime'] = df_rain_new.at[irow, 'datetime']
+    for sta in stations:
+        if sta not in df_rain.columns:
+            df_rain[sta] = np.nan
+        if sta in df_rain_new.columns and df_rain_new[sta].notna().any():
+            for row_new in np.where(~df_rain_new[sta].isna())[0]:
+                row = np.where(df_rain['datetime'] == df_rain_new.at[row_new, 'datetime'])[0]
+                if len(row) == 0:
+                    raise ValueError('Datetime mismatch when updating rain data')
+                df_rain.at[row[0], sta] = df_rain_new.at[row_new, sta]
+    return df_rain
+
+
+def loop_temp(df_temp, df_new, stations):
+    new_datetimes = df_new['datetime'].values
+    missing_datetimes = [dt for dt in new_datetimes if dt not in df_temp['datetime'].values]
+    if missing_datetimes:
+        df_missing = pd.DataFrame({'datetime': missing_datetimes})
+        for col in df_temp.columns:
+            if col != 'datetime':
+                df_missing[col] = np.nan
+        df_temp = pd.concat([df_temp, df_missing]).sort_values('datetime').reset_index(drop=True)
+    for sta in stations:
+        if sta not in df_new.columns:
+            continue
+        for _, row in df_new.iterrows():
+            dt = row['datetime']
+            val = row[sta]
+            if pd.notna(val):
+                df_temp.loc[df_temp['datetime'] == dt, sta] = val
+    return df_temp
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'data/temp_max_2025.csv'
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    full = pd.read_csv(path)
+    stations = list(full.columns[1:])
+    cut = len(full) - 24 * (days - 1)  # the file ends days - 1 days before the year does
+    df = full.iloc[:cut].reset_index(drop=True)
+    df_new = full.iloc[len(full) - 24 * days:].reset_index(drop=True)
+    rng = np.random.default_rng(0)
+    revised = rng.random(df_new[stations].shape) < 0.1
+    df_new[stations] = df_new[stations].mask(revised, df_new[stations] + 0.1)
+    print(f'{path}: {len(df)} hours x {len(stations)} stations, {len(df_new)} new hours')
+    results = {}
+    for name, merge in [('rain loop', loop_rain), ('temp loop', loop_temp), ('upsert', upsert)]:
+        t0 = time.time()
+        results[name] = merge(df.copy(), df_new.copy(), stations)
+        print(f'{name:>10}: {time.time() - t0:7.3f} s')
+    same = all(results['upsert'].equals(results[name]) for name in ['rain loop', 'temp loop'])
+    print('same frames' if same else 'FRAMES DIFFER')
+    sys.exit(0 if same else 1)
+
+
+if __name__ == '__main__':
+    main()
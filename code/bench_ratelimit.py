@@ -0,0 +1,68 @@
+"""
+bench_ratelimit.py
+
+Checks the shared token bucket (ratelimit.py) the way overlapping cron jobs use it: several
+processes, each with several threads, take tokens from one bucket as fast as they can. The
+request starts of all processes together must stay within burst + rate * elapsed. Exits with
+status 1 if they don't.
+
+Usage (from the repository root):
+    python code/bench_ratelimit.py                 # 4 processes x 8 threads, 200 requests, 20/s burst 10
+    python code/bench_ratelimit.py 6 16 600 50 20  # processes, threads, requests, rate, burst
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WORKER = '''
+import sys, json, time, threading
+sys.path.insert(0, {code_dir!r})
+from ratelimit import TokenBucket
+bucket = TokenBucket('bench', rate={rate}, burst={burst}, root={root!r})
+starts = []
+def work():
+    for _ in range({count}):
+        bucket.acquire()
+        starts.append(time.time())
+threads = [threading.Thread(target=work) for _ in range({threads})]
+for t in threads: t.start()
+for t in threads: t.join()
+print(json.dumps(starts))
+'''
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    requests = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    rate = float(sys.argv[4]) if len(sys.argv) > 4 else 20
+    burst = float(sys.argv[5]) if len(sys.argv) > 5 else 10
+    count = max(1, requests // (processes * threads))
+    with tempfile.TemporaryDirectory() as root:
+        code = WORKER.format(code_dir=CODE_DIR, rate=rate, burst=burst, root=root, count=count, threads=threads)
+        t0 = time.time()
+        procs = [subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, text=True)
+                 for _ in range(processes)]
+        starts = sorted(s for p in procs for s in json.loads(p.communicate()[0]))
+        elapsed = time.time() - t0
+        with open(os.path.join(root, 'bench.json')) as f:
+            state = json.load(f)
+    # worst window: most starts within any span, against what the bucket allows in that span
+    excess = max(i - j + 1 - (burst + rate * (starts[i] - starts[j]))
+                 for i in range(len(starts)) for j in range(max(0, i - 2 * int(burst + rate)), i + 1))
+    total = len(starts)
+    print(f'{processes} processes x {threads} threads, {total} requests at {rate:g}/s burst {burst:g}: '
+          f'{elapsed:.1f} s (ideal {max(0, total - burst) / rate:.1f} s)')
+    print(f"waited {state['waited']} times, {state['wait_seconds']:.1f} s in total, max {state['max_wait']:.2f} s")
+    ok = excess <= 1e-6 + 1  # one start of slack for clock reads after the token was taken
+    print('ok' if ok else f'FAIL {excess:.1f} starts over the limit')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
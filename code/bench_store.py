@@ -0,0 +1,62 @@
+"""
+bench_store.py
+
+Full-history load of the yearly files in data/, straight from the CSVs (pd.read_csv +
+pd.to_datetime, as the analysis scripts did) against the binary mirrors (store.read_year).
+Each way runs in a fresh process, so the peak memory reported is its own. The loaded frames
+are compared and the script exits with status 1 if they differ.
+
+Usage (from the repository root):
+    python code/store.py               # build the mirrors first
+    python code/bench_store.py         # all yearly files
+    python code/bench_store.py rain    # only rain_*.csv
+"""
+import os
+import sys
+import json
+import subprocess
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WORKER = '''
+import sys, json, time, resource, hashlib
+sys.path.insert(0, {code_dir!r})
+import pandas as pd
+from store import read_year, yearly_files
+files = [f for f in yearly_files() if f.split('/')[-1].startswith({prefix!r})]
+digest = hashlib.sha1()
+t0 = time.time()
+for file in files:
+    if {mirror}:
+        df = read_year(file, parse_dates=True)
+    else:
+        df = pd.read_csv(file)
+        df['datetime'] = pd.to_datetime(df['datetime'])
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    digest.update('|'.join(df.columns).encode())
+elapsed = time.time() - t0
+print(json.dumps([len(files), elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, digest.hexdigest()]))
+'''
+
+
+def run(prefix, mirror):
+    code = WORKER.format(code_dir=CODE_DIR, prefix=prefix, mirror=mirror)
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def main():
+    prefix = sys.argv[1] if len(sys.argv) > 1 else ''
+    results = {}
+    for name, mirror in [('csv', False), ('mirror', True)]:
+        files, elapsed, rss, digest = run(prefix, mirror)
+        results[name] = (elapsed, digest)
+        print(f'{name:>6}: {files} files in {elapsed:6.2f} s, peak RSS {rss / 1024:6.0f} MB')
+    speedup = results['csv'][0] / results['mirror'][0]
+    same = results['csv'][1] == results['mirror'][1]
+    print(f'speedup {speedup:.1f}x, frames {"identical" if same else "DIFFER"}')
+    sys.exit(0 if same else 1)
+
+
+if __name__ == '__main__':
+    main()
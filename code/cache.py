@@ -0,0 +1,177 @@
+"""
+cache.py
+
+Content-addressed on-disk cache of raw IMS API responses.
+
+Bodies are stored gzip-compressed and named by the sha256 of their content, so identical
+payloads are stored once. A small ref file per request (keyed by the request path, i.e.
+station, channel and date window) points at the body:
+
+    data/cache/api/objects/ab/ab12....json.gz
+    data/cache/api/refs/cd/cd34....json      {"url": ..., "object": ..., "fetched": ..., "closed": ...}
+
+Windows that ended before today never change and never expire (IMS may still revise the
+last couple of days, so those count as open too). Windows that reach today expire after a
+TTL. In offline mode a miss is returned as None without touching the network, so the
+collectors can rebuild the yearly CSVs from the cache alone.
+
+Settings (env vars):
+    IMS_CACHE       0 disables the cache. Default is 1.
+    IMS_CACHE_DIR   Cache directory. Default is data/cache/api.
+    IMS_CACHE_TTL   Seconds a window that reaches today stays valid. Default is 3600.
+    IMS_OFFLINE     1 serves from the cache only. Default is 0.
+"""
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+# windows ending within this many days before today may still be revised by IMS
+OPEN_DAYS = 2
+
+
+class ResponseCache:
+    """
+    Inputs:
+        root (str): Cache directory. Default from IMS_CACHE_DIR (data/cache/api).
+        ttl (float): Seconds a cached window that reaches today stays valid. Default from IMS_CACHE_TTL.
+        offline (bool): Serve from the cache only. Default from IMS_OFFLINE.
+    """
+    def __init__(self, root=None, ttl=None, offline=None):
+        self.root = root or os.environ.get('IMS_CACHE_DIR', 'data/cache/api')
+        self.ttl = float(os.environ.get('IMS_CACHE_TTL', 3600) if ttl is None else ttl)
+        self.offline = os.environ.get('IMS_OFFLINE', '0') == '1' if offline is None else offline
+
+    @staticmethod
+    def request_key(url):
+        """
+        Key of a request: its path and query, without scheme and host, so a local stand-in
+        server and the real API share cache entries.
+        """
+        parts = urlsplit(url)
+        path = parts.path.lower()
+        if parts.query:
+            path += '?' + parts.query
+        return path
+
+    def _ref_path(self, url):
+        digest = hashlib.sha256(self.request_key(url).encode('utf8')).hexdigest()
+        return os.path.join(self.root, 'refs', digest[:2], digest + '.json')
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest + '.json.gz')
+
+    def _valid_ref(self, url):
+        try:
+            with open(self._ref_path(url)) as f:
+                ref = json.load(f)
+            if not ref['closed'] and not self.offline and time.time() - ref['fetched'] > self.ttl:
+                return None
+            return ref
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def get(self, url):
+        """
+        Outputs:
+            bytes or None: Cached body, or None if missing or expired.
+        """
+        ref = self._valid_ref(url)
+        if ref is None:
+            return None
+        try:
+            with gzip.open(self._object_path(ref['object']), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def open(self, url):
+        """
+        Outputs:
+            file or None: Cached body as a binary file to read in chunks (close it after use),
+                          or None if missing or expired.
+        """
+        ref = self._valid_ref(url)
+        if ref is None:
+            return None
+        try:
+            return gzip.open(self._object_path(ref['object']), 'rb')
+        except OSError:
+            return None
+
+    def put(self, url, body, window_end):
+        """
+        Stores a body.
+
+        Inputs:
+            url (str): Request url.
+            body (bytes): Response body.
+            window_end (str): Last date of the queried window 'YYYY-MM-DD'.
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            _write_atomic(object_path, gzip.compress(body))
+        self._put_ref(url, digest, window_end)
+
+    def writer(self, url, window_end):
+        """
+        Stores a body that arrives in chunks, see CacheWriter.
+        """
+        return CacheWriter(self, url, window_end)
+
+    def _put_ref(self, url, digest, window_end):
+        closed_before = (datetime.now() - timedelta(days=OPEN_DAYS)).strftime('%Y-%m-%d')
+        ref = {'url': self.request_key(url), 'object': digest, 'fetched': time.time(),
+               'closed': window_end < closed_before}
+        _write_atomic(self._ref_path(url), json.dumps(ref).encode('utf8'))
+
+
+class CacheWriter:
+    """
+    Streams one body into the cache: hashed and compressed chunk by chunk into a temporary
+    file, published under its digest by commit(), dropped by abort().
+    """
+    def __init__(self, cache, url, window_end):
+        self.cache = cache
+        self.url = url
+        self.window_end = window_end
+        os.makedirs(os.path.join(cache.root, 'objects'), exist_ok=True)
+        self.tmp = os.path.join(cache.root, 'objects', f'{os.getpid()}.{threading.get_ident()}.{time.time_ns()}.tmp')
+        self.file = open(self.tmp, 'wb')
+        self.gzip = gzip.GzipFile(fileobj=self.file, mode='wb')
+        self.sha = hashlib.sha256()
+
+    def write(self, chunk):
+        self.sha.update(chunk)
+        self.gzip.write(chunk)
+
+    def commit(self):
+        self.gzip.close()
+        self.file.close()
+        digest = self.sha.hexdigest()
+        object_path = self.cache._object_path(digest)
+        if os.path.exists(object_path):
+            os.remove(self.tmp)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(self.tmp, object_path)
+        self.cache._put_ref(self.url, digest, self.window_end)
+
+    def abort(self):
+        self.gzip.close()
+        self.file.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+def _write_atomic(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.{time.time_ns()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, path)
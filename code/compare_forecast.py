@@ -1,5 +1,6 @@
 import pandas as pd
 import os
+from store import read_year
 
 # Approved station mapping
 STATION_MAPPING = {
@@ -22,8 +23,7 @@ STATION_MAPPING = {
 
 def load_and_aggregate_actuals(file_path, agg_func):
     """Loads hourly data and aggregates to daily values."""
-    df = pd.read_csv(file_path)
-    df['datetime'] = pd.to_datetime(df['datetime'])
+    df = read_year(file_path, parse_dates=True)
     df['date'] = df['datetime'].dt.date
     
     # Drop datetime and group by date
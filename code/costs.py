@@ -0,0 +1,160 @@
+"""
+costs.py
+
+Recorded cost of the API's data requests, kept in data/cache/costs.json, for the planner
+(planner.py) to estimate a run before it runs:
+
+    {"channel": {"requests": 812, "days": 1990, "bytes": 40212345, "seconds": 615.2, ...},
+     "all": {...}}
+
+Every data request the client gets over the network (not from the response cache) adds its
+window's days, its body's bytes and its time to the totals of its kind: one channel ('channel')
+or all channels of a station ('all', see query_station). A request's size is then estimated as
+bytes per day times its days, and its time as a fixed latency plus a time per byte, fitted to
+the recorded requests by least squares. A kind not recorded yet takes the other kind's fit,
+with its bytes per day scaled as in the rough defaults used when nothing is recorded.
+
+Usage:
+    costs = Costs()
+    costs.record(url, nbytes, seconds)    # done by IMSClient.get_records
+    costs.save()                          # adds this run's requests to the file
+    nbytes, seconds = costs.estimate('channel', days=2)
+"""
+import os
+import json
+import threading
+from urllib.parse import urlsplit, parse_qs
+from datetime import datetime
+from cache import _write_atomic
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+COSTS_JSON = 'data/cache/costs.json'
+TOTALS = ['requests', 'days', 'bytes', 'seconds', 'bytes2', 'bytes_seconds']
+# per day of a window and per request, before any request of the kind is recorded
+DEFAULTS = {'channel': (20000, 1.0), 'all': (200000, 1.5)}
+
+
+def request_shape(url):
+    """
+    Outputs:
+        (str, int): Kind of a data request url, 'channel' or 'all', and the days of its window.
+    """
+    parts = urlsplit(url)
+    path = parts.path.rstrip('/')
+    if '/daily/' in path:
+        kind = 'all' if path.split('/daily/')[0].endswith('/data') else 'channel'
+        return kind, 1
+    kind = 'all' if path.endswith('/data') else 'channel'
+    query = parse_qs(parts.query)
+    first, last = (datetime.strptime(query[key][0], '%Y/%m/%d') for key in ['from', 'to'])
+    return kind, (last - first).days + 1
+
+
+class Costs:
+    """
+    Inputs:
+        path (str): Costs JSON. Default from IMS_COSTS (data/cache/costs.json).
+    """
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('IMS_COSTS', COSTS_JSON)
+        self.totals = self._load()
+        self.new = {}  # kind -> totals recorded by this process, not saved yet
+        self.lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return {kind: {key: float(totals[key]) for key in TOTALS} for kind, totals in json.load(f).items()}
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def record(self, url, nbytes, seconds):
+        """
+        Adds a data request made over the network.
+
+        Inputs:
+            url (str): Request url, see weather.data_url.
+            nbytes (int): Bytes of the response body.
+            seconds (float): Time from sending the request to the end of the body.
+        """
+        try:
+            kind, days = request_shape(url)
+        except (KeyError, ValueError):
+            return  # not a data request
+        values = [1, days, nbytes, seconds, float(nbytes) ** 2, nbytes * seconds]
+        with self.lock:
+            for totals in (self.totals, self.new):
+                kind_totals = totals.setdefault(kind, dict.fromkeys(TOTALS, 0.0))
+                for key, value in zip(TOTALS, values):
+                    kind_totals[key] += value
+
+    def _model(self, kind):
+        # (bytes per day, seconds per request, seconds per byte) fitted to the recorded requests
+        totals = self.totals.get(kind)
+        if totals is None or totals['requests'] == 0:
+            return None
+        n, b, s = totals['requests'], totals['bytes'], totals['seconds']
+        # seconds = latency + per_byte * bytes, or the mean time if the sizes don't vary enough
+        spread = n * totals['bytes2'] - b * b
+        if n >= 3 and spread > 0:
+            per_byte = (n * totals['bytes_seconds'] - b * s) / spread
+            latency = (s - per_byte * b) / n
+            if per_byte >= 0 and latency >= 0:
+                return b / totals['days'], latency, per_byte
+        return b / totals['days'], s / n, 0.0
+
+    def estimate(self, kind, days):
+        """
+        Outputs:
+            (float, float): Estimated bytes and seconds of one request of a kind over days.
+        """
+        model = self._model(kind)
+        if model is None:
+            # the other kind's latency and rate, with the defaults' ratio of bytes per day
+            other = 'all' if kind == 'channel' else 'channel'
+            model = self._model(other)
+            if model is None:
+                model = DEFAULTS[kind] + (0.0,)
+            else:
+                model = (model[0] * DEFAULTS[kind][0] / DEFAULTS[other][0],) + model[1:]
+        per_day, latency, per_byte = model
+        nbytes = per_day * days
+        return nbytes, latency + per_byte * nbytes
+
+    def recorded(self, kind):
+        """
+        Outputs:
+            int: Number of recorded requests of a kind, 0 if the estimates are the defaults.
+        """
+        return int(self.totals.get(kind, {}).get('requests', 0))
+
+    def save(self):
+        """
+        Adds the requests recorded since the last save to the file, as it is now (other
+        processes may have saved theirs meanwhile). The file is read and written under an
+        exclusive lock (fcntl, on a .lock file next to it), so processes saving at the same time
+        don't drop each other's requests.
+        """
+        with self.lock:
+            new, self.new = self.new, {}
+        if not new:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            totals = self._load()
+            for kind, kind_new in new.items():
+                kind_totals = totals.setdefault(kind, dict.fromkeys(TOTALS, 0.0))
+                for key in TOTALS:
+                    kind_totals[key] += kind_new[key]
+            _write_atomic(self.path, json.dumps(totals, indent=1).encode('utf8'))
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self.totals = totals
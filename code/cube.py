@@ -0,0 +1,403 @@
+"""
+cube.py
+
+Memory-mapped hours x stations cube of one variable (rain, temp_min, temp_max, grad, rh, ws,
+wd) spanning all its yearly files.
+
+Multi-year analyses (Sep-Aug winters, Mar-Feb summers, per-month regional medians) read the
+year files one at a time and stitched the windows with pd.concat. The cube holds every year of
+a variable in one .npy file, one row per hour from Jan 1 00:00 of its first year (1989 for
+rain), one column per station. A window across years is then a row slice of a read-only
+np.memmap: no copy, and every process reading the cube shares the same pages of the OS cache.
+
+    data/cache/cube/rain.npy    float32, hours x columns, NaN where there is no data
+    data/cache/cube/rain.json   {"start": "1989-01-01 00:00", "stations": ["ZIKHRON YAAQOV", ...],
+                                 "decimals": 1, "years": {"1989": {"stamp": [mtime_ns, size],
+                                                     "columns": [0], "hours": 8760}, ...}}
+
+The JSON sidecar maps columns to stations and keeps, per year, the mtime and size of the CSV
+the rows were copied from, the columns that CSV has and its number of hours, so a window knows
+which stations had a column in its years and ends where the last CSV ends, as pd.concat of the
+years' CSVs would. open_cube brings the cube up to date first: the rows of a year whose CSV
+changed are rewritten, and the file is rebuilt only for a year past its end or when new
+stations outgrow the spare columns. Values are float32 like the store mirrors (store.py) and
+frame() rounds them back to the CSVs' float64 numbers.
+
+A cube is never written where it is mapped: refresh writes the rows into a copy of the file and
+replaces the file with it (os.replace), under an exclusive lock. A Cube opens the JSON and the
+.npy under a shared lock, so it gets a matching pair, and keeps the file it mapped, whole, for
+as long as it is used, while another process refreshes the cube.
+
+Settings (env vars):
+    IMS_CUBE_DIR   Directory of the cubes. Default is data/cache/cube.
+
+Usage:
+    from cube import open_cube
+    cube = open_cube('rain')
+    values = cube.take(from_date='2023-09-01', to_date='2024-09-01')         # view, hours x stations
+    values = cube.take(['BET DAGAN'], '2023-09-01', '2024-09-01')            # view, hours x 1
+    df = cube.frame(['BET DAGAN', 'ARAD'], '2023-09-01', '2024-09-01')       # as read_rain
+
+    python code/cube.py                  # build or update the cubes of all variables
+    python code/cube.py rain --verify    # check a cube against the CSVs
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+from cache import _write_atomic
+from store import sync, mirror_path, _load, _dense, _decimals, _stamp, _frame
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+VARIABLES = ['rain', 'temp_min', 'temp_max', 'grad', 'rh', 'ws', 'wd']
+# columns kept free for stations that start reporting, so they don't rebuild the cube
+SPARE = 32
+
+
+def cube_dir():
+    return os.environ.get('IMS_CUBE_DIR', 'data/cache/cube')
+
+
+def year_files(variable, data_dir='data'):
+    """
+    Outputs:
+        dict: Year (int) -> path of the variable's yearly CSV, in year order.
+    """
+    pattern = re.compile(rf'^{variable}_(\d{{4}})\.csv$')
+    files = {}
+    for name in sorted(os.listdir(data_dir)):
+        match = pattern.match(name)
+        if match:
+            files[int(match.group(1))] = os.path.join(data_dir, name)
+    return files
+
+
+def _year_arrays(csv_path):
+    # datetime, stations and float64 values of a yearly CSV, through its store mirror
+    sync(csv_path)
+    arrays = _load(mirror_path(csv_path), _stamp(csv_path))
+    if arrays is None:
+        df = pd.read_csv(csv_path)
+        values = df[df.columns[1:]].to_numpy(dtype=np.float64)
+        decimals = _decimals(values)
+        return {'datetime': pd.to_datetime(df['datetime']).to_numpy().astype('datetime64[m]'),
+                'stations': list(df.columns[1:]), 'values': values,
+                'decimals': -1 if decimals is None else decimals}
+    return {'datetime': arrays['datetime'], 'stations': arrays['stations'].tolist(),
+            'values': _dense(arrays), 'decimals': int(arrays['decimals'])}
+
+
+def _hours(first_year, last_year):
+    return int((np.datetime64(f'{last_year + 1}-01-01T00', 'h') - np.datetime64(f'{first_year}-01-01T00', 'h'))
+               .astype(int))
+
+
+class _Lock:
+    # lock of a cube across processes (fcntl, none on Windows): exclusive while it is written,
+    # shared while it is opened
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self.fd = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+
+
+def _read_meta(path):
+    try:
+        with open(path, encoding='utf8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_year(values, meta, year, arrays):
+    start = np.datetime64(meta['start'], 'h')
+    first = int((np.datetime64(f'{year}-01-01T00', 'h') - start).astype(int))
+    block = values[first:first + _hours(year, year)]
+    block[:] = np.nan
+    index = {name: col for col, name in enumerate(meta['stations'])}
+    columns = [index[name] for name in arrays['stations']]
+    rows = (arrays['datetime'].astype('datetime64[h]') - start).astype(int) - first
+    keep = (rows >= 0) & (rows < len(block))  # a CSV may run into the next year, that's the next file's
+    if columns:
+        block[rows[keep, None], columns] = arrays['values'][keep]
+    meta['years'][str(year)]['columns'] = columns
+    meta['years'][str(year)]['hours'] = int(rows[keep].max()) + 1 if keep.any() else 0
+
+
+def refresh(variable, data_dir='data'):
+    """
+    Brings the cube of a variable up to date with its yearly CSVs.
+
+    Inputs:
+        variable (str): 'rain', 'temp_min', 'temp_max', 'grad', 'rh', 'ws' or 'wd'.
+        data_dir (str): Directory of the yearly CSVs. Default is data.
+
+    Outputs:
+        bool: True if the cube was written.
+    """
+    files = year_files(variable, data_dir)
+    if not files:
+        raise FileNotFoundError(f'no {variable}_YYYY.csv in {data_dir}')
+    npy = os.path.join(cube_dir(), f'{variable}.npy')
+    with _Lock(os.path.join(cube_dir(), f'{variable}.lock')):
+        meta = _read_meta(npy[:-4] + '.json')
+        if meta is not None and not os.path.exists(npy):
+            meta = None
+        stamps = {str(year): _stamp(path).tolist() for year, path in files.items()}
+        if meta is not None and meta.get('data_dir') == os.path.abspath(data_dir) \
+                and {year: info['stamp'] for year, info in meta['years'].items()} == stamps:
+            return False
+        if meta is not None:
+            stale = [year for year in files if meta['years'].get(str(year), {}).get('stamp') != stamps[str(year)]]
+        else:
+            stale = list(files)
+        loaded = {year: _year_arrays(files[year]) for year in stale}
+        new = []
+        for arrays in loaded.values():
+            new += [name for name in arrays['stations'] if name not in new]
+        rebuild = meta is None or meta.get('data_dir') != os.path.abspath(data_dir) \
+            or set(meta['years']) - set(stamps) \
+            or min(files) < int(meta['start'][:4]) or max(files) > int(meta['end'][:4])
+        if not rebuild:
+            new = [name for name in new if name not in meta['stations']]
+            decimals = [arrays['decimals'] for arrays in loaded.values()]
+            rebuild = len(meta['stations']) + len(new) > meta['columns'] \
+                or (meta['dtype'] == 'float32' and min(decimals) < 0)
+            if not rebuild:
+                meta['stations'] += new
+                meta['decimals'] = max([meta['decimals']] + decimals)
+        if rebuild:
+            for year in files:
+                if year not in loaded:
+                    loaded[year] = _year_arrays(files[year])
+            stations = []
+            for year in files:
+                stations += [name for name in loaded[year]['stations'] if name not in stations]
+            decimals = [loaded[year]['decimals'] for year in files]
+            meta = {'start': f'{min(files)}-01-01 00:00', 'end': f'{max(files)}-12-31 23:00',
+                    'data_dir': os.path.abspath(data_dir), 'stations': stations,
+                    'columns': len(stations) + SPARE,
+                    'dtype': 'float32' if min(decimals) >= 0 else 'float64',
+                    'decimals': max(decimals) if min(decimals) >= 0 else -1, 'years': {}}
+        # readers may have the cube mapped, the rows are written into a copy
+        tmp = f'{npy}.{os.getpid()}.tmp'
+        if rebuild:
+            values = np.lib.format.open_memmap(tmp, mode='w+', dtype=meta['dtype'],
+                                               shape=(_hours(min(files), max(files)), meta['columns']))
+            values[:] = np.nan
+        else:
+            shutil.copyfile(npy, tmp)
+            values = np.load(tmp, mmap_mode='r+')
+        for count, year in enumerate(loaded):
+            meta['years'][str(year)] = {'stamp': stamps[str(year)]}
+            _write_year(values, meta, year, loaded[year])
+            msg = f'{variable} cube: {year} ({count + 1}/{len(loaded)})'
+            print(f'\r{msg:<80}', end='', flush=True)
+        values.flush()
+        del values
+        os.replace(tmp, npy)
+        meta['years'] = dict(sorted(meta['years'].items()))
+        _write_atomic(npy[:-4] + '.json', json.dumps(meta, ensure_ascii=False).encode('utf8'))
+        print()
+        return True
+
+
+class Cube:
+    """
+    Read-only view of a variable's cube. Use open_cube to get one.
+
+    Attributes:
+        stations (list): Station of each column.
+        start (numpy.datetime64): Hour of row 0.
+        values (numpy.memmap): hours x columns, the columns past len(stations) are spare (NaN).
+        stop (int): Row past the last hour of data.
+    """
+    def __init__(self, variable):
+        npy = os.path.join(cube_dir(), f'{variable}.npy')
+        with _Lock(os.path.join(cube_dir(), f'{variable}.lock'), shared=True):
+            meta = _read_meta(npy[:-4] + '.json')
+            if meta is None or not os.path.exists(npy):
+                raise FileNotFoundError(f'no cube for {variable} in {cube_dir()}, run code/cube.py')
+            values = np.load(npy, mmap_mode='r')
+        self.variable = variable
+        self.meta = meta
+        self.stations = meta['stations']
+        self.index = {name: col for col, name in enumerate(self.stations)}
+        self.start = np.datetime64(meta['start'], 'h')
+        self.decimals = meta['decimals']
+        self.values = values
+        last = max(meta['years'], key=int)
+        # rows past the last CSV's last hour are allocated but hold no data yet
+        self.stop = int((np.datetime64(f'{last}-01-01T00', 'h') - self.start).astype(int)) \
+            + meta['years'][last]['hours']
+
+    def rows(self, from_date=None, to_date=None):
+        """
+        Outputs:
+            slice: Rows of from_date <= datetime < to_date, clipped to the data. Dates are
+                   'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM', the default is the whole cube.
+        """
+        def row(date, default):
+            if date is None:
+                return default
+            hour = np.datetime64(date, 'm')
+            offset = (hour - self.start.astype('datetime64[m]')).astype(int)
+            return int(min(max(-(-offset // 60), 0), self.stop))
+        return slice(row(from_date, 0), row(to_date, self.stop))
+
+    def datetime(self, from_date=None, to_date=None):
+        """
+        Outputs:
+            numpy.ndarray: datetime64[m] of the rows of the window.
+        """
+        rows = self.rows(from_date, to_date)
+        return (self.start + np.arange(rows.start, rows.stop)).astype('datetime64[m]')
+
+    def present(self, from_date=None, to_date=None):
+        """
+        Outputs:
+            list: Stations that have a column in the CSV of any year of the window, in cube order.
+        """
+        rows = self.rows(from_date, to_date)
+        if rows.stop <= rows.start:
+            return []
+        first = str(self.start + rows.start)[:4]
+        last = str(self.start + rows.stop - 1)[:4]
+        columns = set()
+        for year, info in self.meta['years'].items():
+            if first <= year <= last:
+                columns.update(info['columns'])
+        return [self.stations[col] for col in sorted(columns)]
+
+    def take(self, stations=None, from_date=None, to_date=None):
+        """
+        Values of some stations over a window, as stored (float32, not rounded).
+
+        Inputs:
+            stations (list): Station names, all in the cube. Default is all stations.
+            from_date (str): Start, inclusive. Default is the first hour of the cube.
+            to_date (str): End, exclusive. Default is past the last hour of the cube.
+
+        Outputs:
+            numpy.ndarray: hours x stations. A view of the memory map (no copy) for all stations
+                           or stations in consecutive columns, e.g. one station, otherwise a copy
+                           of the selected columns only.
+        """
+        rows = self.rows(from_date, to_date)
+        if stations is None:
+            return self.values[rows, :len(self.stations)]
+        columns = [self.index[name] for name in stations]
+        if len(columns) > 0 and columns == list(range(columns[0], columns[0] + len(columns))):
+            return self.values[rows, columns[0]:columns[0] + len(columns)]
+        return self.values[rows][:, columns]
+
+    def exact(self, values):
+        """
+        Outputs:
+            numpy.ndarray: float64 copy of values taken from the cube (or their min, max, ...)
+                           rounded back to the numbers in the CSVs.
+        """
+        values = np.asarray(values, dtype=np.float64).copy()
+        if self.decimals >= 0:
+            np.round(values, self.decimals, out=values)
+        return values
+
+    def frame(self, stations=None, from_date=None, to_date=None, parse_dates=False):
+        """
+        Values over a window as a DataFrame, like pd.concat of the years' CSVs.
+
+        Inputs:
+            stations (list): Station names. Default is the stations with a column in the window's
+                             years (present). Names not in the cube give NaN columns.
+            from_date, to_date (str): Window as in take.
+            parse_dates (bool): If True, the datetime column is converted like pd.to_datetime does.
+
+        Outputs:
+            pandas.DataFrame: datetime and one float64 column per station.
+        """
+        stations = self.present(from_date, to_date) if stations is None else list(stations)
+        known = [name for name in stations if name in self.index]
+        values = np.full((len(self.datetime(from_date, to_date)), len(stations)), np.nan)
+        if known:
+            part = self.exact(self.take(known, from_date, to_date))
+            values[:, [col for col, name in enumerate(stations) if name in self.index]] = part
+        return _frame(self.datetime(from_date, to_date), stations, values, parse_dates)
+
+
+def open_cube(variable, update=True, data_dir='data'):
+    """
+    Inputs:
+        variable (str): 'rain', 'temp_min', 'temp_max', 'grad', 'rh', 'ws' or 'wd'.
+        update (bool): If True (default), bring the cube up to date with the CSVs first.
+        data_dir (str): Directory of the yearly CSVs. Default is data.
+
+    Outputs:
+        Cube: The variable's cube.
+    """
+    if update:
+        refresh(variable, data_dir)
+    return Cube(variable)
+
+
+def verify(variable, data_dir='data'):
+    """
+    Outputs:
+        list: Years whose CSV differs from the cube's rows.
+    """
+    cube = open_cube(variable, data_dir=data_dir)
+    failed = []
+    for year, path in year_files(variable, data_dir).items():
+        expected = pd.read_csv(path)
+        # rows outside the file's year aren't copied (grad_2025.csv runs into 2026)
+        expected = expected[expected['datetime'].str[:4] == str(year)]
+        df = cube.frame(list(expected.columns[1:]), f'{year}-01-01', f'{year + 1}-01-01')
+        df = df.iloc[:len(expected)]  # hours after a short CSV are NaN when a later year follows
+        if not df.equals(expected) or cube.present(f'{year}-01-01', f'{year + 1}-01-01') != \
+                sorted(expected.columns[1:], key=cube.index.get):
+            failed.append(year)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or update the memory-mapped cubes.')
+    parser.add_argument('variables', nargs='*', default=None, help=f'default: {" ".join(VARIABLES)}')
+    parser.add_argument('--verify', action='store_true', help='check the cubes against the CSVs')
+    args = parser.parse_args()
+    failed = {}
+    for variable in args.variables or VARIABLES:
+        if not year_files(variable):
+            continue
+        if args.verify:
+            years = verify(variable)
+            print(f'{variable}: {"ok" if not years else f"differs in {years}"}')
+            if years:
+                failed[variable] = years
+        else:
+            refresh(variable)
+            cube = Cube(variable)
+            print(f'{variable}: {cube.values.shape[0]} hours x {len(cube.stations)} stations, '
+                  f'{cube.values.nbytes / 1e6:.0f} MB')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
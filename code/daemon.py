@@ -0,0 +1,232 @@
+"""
+daemon.py
+
+Runs the collection jobs of the workflows in one long-running process, each on its own schedule,
+instead of a new Python process per script.
+
+The process imports pandas and the collectors once and keeps what they read in memory: the
+stations registry (registry.py, reloaded only when ims_stations.csv changes) and the frames of
+the current year's files (store.keep_resident), which the update engine and the per-month
+scripts read on every run. A frame is read again only when its CSV changed on disk.
+
+A job updates the yearly files of its monitors through the update engine (update_engine.py),
+which writes only the lines that changed, then runs the scripts that build on those files, as
+python code/<script> would, when the update changed a file. A job without monitors runs its
+scripts every time. A failing job is recorded and tried again at its next run, the other jobs
+go on.
+
+The status file (IMS_DAEMON_STATUS, default data/cache/daemon.json) is rewritten at every step
+and at least once a minute while idle: a heartbeat, the job running, and for every job its last
+start, end, duration, result and next run. --status prints it and exits with 1 if the heartbeat
+is stale or a job's last run failed, as a health check.
+
+Usage (from the repository root):
+    python code/daemon.py                          # all jobs, forever
+    python code/daemon.py rain temp --every rain=30
+    python code/daemon.py --once temp               # run jobs once and exit
+    python code/daemon.py --status                  # health check
+"""
+import os
+import sys
+import json
+import time
+import runpy
+import signal
+import argparse
+import threading
+import traceback
+from datetime import datetime, timedelta
+import store
+from cache import _write_atomic
+from update_engine import update
+from weather import update_stations, get_client, file_prefix
+
+# minutes between runs, monitors updated by the engine, scripts run after a change of their files
+JOBS = {'monitor': (60, ['Grad', 'RH', 'WS', 'WD'], []),
+        'predictions': (360, [], ['collect_predictions.py']),
+        'rain': (60, ['Rain'], ['rain_per_month.py']),
+        'temp': (60, ['TDmin', 'TDmax'],
+                 ['temp_per_month.py', 'generate_temp_mean.py', 'generate_station_monthly.py'])}
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def status_path():
+    return os.environ.get('IMS_DAEMON_STATUS', 'data/cache/daemon.json')
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Status:
+    """
+    The status file: the process, its heartbeat and the runs of every job.
+    """
+    def __init__(self, jobs, every, path=None):
+        self.path = path or status_path()
+        self.state = {'pid': os.getpid(), 'started': _now(), 'heartbeat': None, 'running': None,
+                      'resident': {}, 'jobs': {name: {'every': every[name], 'runs': 0, 'failures': 0,
+                                                      'last_start': None, 'last_end': None,
+                                                      'seconds': None, 'ok': None, 'error': None,
+                                                      'next_run': None} for name in jobs}}
+
+    def beat(self, running=None):
+        self.state['heartbeat'] = _now()
+        self.state['running'] = running
+        self.state['resident'] = {os.path.basename(path): round(size / 2**20, 1)
+                                  for path, size in store.resident_files().items()}
+        _write_atomic(self.path, json.dumps(self.state, indent=1).encode('utf8'))
+
+    def job(self, name):
+        return self.state['jobs'][name]
+
+
+def file_stamps(monitors):
+    # mtime and size of the current year's files of monitors, None for a missing file
+    year = datetime.now().year
+    stamps = []
+    for monitor in monitors:
+        path = f'data/{file_prefix(monitor)}_{year}.csv'
+        stamps.append(store._stamp(path).tolist() if os.path.exists(path) else None)
+    return stamps
+
+
+def run_script(script):
+    """
+    Runs a script of code/ in this process, as python code/<script> would (without arguments).
+    Exiting with 0 (e.g. collect_predictions.py with nothing new) is a success.
+    """
+    argv, path = sys.argv, list(sys.path)
+    sys.argv = [os.path.join(CODE_DIR, script)]
+    try:
+        runpy.run_path(sys.argv[0], run_name='__main__')
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise RuntimeError(f'{script} exited with {e.code}')
+    finally:
+        sys.argv, sys.path[:] = argv, path
+
+
+def run_job(name, status, concurrency=None):
+    """
+    Runs one job and records it in the status file.
+
+    Outputs:
+        bool: True if the job succeeded.
+    """
+    _, monitors, scripts = JOBS[name]
+    job = status.job(name)
+    job['last_start'] = _now()
+    status.beat(running=name)
+    print(f'[{job["last_start"]}] {name} started')
+    t0 = time.time()
+    try:
+        changed = True
+        if monitors:
+            if 'Rain' in monitors:
+                update_stations()  # as rain_update.py does
+            before = file_stamps(monitors)
+            update(monitors, concurrency=concurrency)
+            changed = file_stamps(monitors) != before
+            status.beat(running=name)
+        for script in scripts if changed else []:
+            run_script(script)
+            status.beat(running=name)
+        job['ok'], job['error'] = True, None
+    except Exception as e:
+        traceback.print_exc()
+        job['ok'], job['error'] = False, f'{type(e).__name__}: {e}'
+        job['failures'] += 1
+    job['runs'] += 1
+    job['last_end'] = _now()
+    job['seconds'] = round(time.time() - t0, 1)
+    print(f'[{job["last_end"]}] {name} {"done" if job["ok"] else "failed"} in {job["seconds"]}s'
+          + ('' if changed or not scripts else ', no new data'))
+    status.beat()
+    return job['ok']
+
+
+def run(jobs, every, concurrency=None, once=False):
+    """
+    Runs jobs, each first at once and then every every[name] minutes after it last started,
+    until SIGTERM or SIGINT (or once each with once=True). A job running then is finished first.
+
+    Outputs:
+        bool: True if the last run of every job succeeded.
+    """
+    store.keep_resident()
+    status = Status(jobs, every)
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    due = {name: time.time() for name in jobs}
+    while not stop.is_set():
+        for name in [name for name in jobs if due[name] <= time.time()]:
+            if stop.is_set():
+                break
+            due[name] += every[name] * 60
+            run_job(name, status, concurrency)
+            due[name] = max(due[name], time.time())  # a job longer than its period runs again next
+            next_run = datetime.now() + timedelta(seconds=due[name] - time.time())
+            status.job(name)['next_run'] = None if once else next_run.strftime('%Y-%m-%d %H:%M:%S')
+        if once:
+            break
+        status.beat()
+        stop.wait(max(0, min(60, min(due.values()) - time.time())))
+    status.beat()
+    print(f'IMS API: {get_client().report()}')
+    return all(status.job(name)['ok'] is not False for name in jobs)
+
+
+def check(path=None, stale=30):
+    """
+    Outputs:
+        list: Problems of a daemon by its status file, empty if it's healthy.
+    """
+    path = path or status_path()
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return [f'no status in {path}']
+    problems = []
+    heartbeat = datetime.strptime(state['heartbeat'], '%Y-%m-%d %H:%M:%S')
+    if datetime.now() - heartbeat > timedelta(minutes=stale):
+        problems.append(f'no heartbeat since {state["heartbeat"]} (pid {state["pid"]})')
+    for name, job in state['jobs'].items():
+        if job['ok'] is False:
+            problems.append(f'{name} failed at {job["last_end"]}: {job["error"]}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the collection jobs in one long-running process.')
+    parser.add_argument('jobs', nargs='*', default=list(JOBS), help=f"jobs, default {', '.join(JOBS)}")
+    parser.add_argument('--every', nargs='+', default=[], metavar='JOB=MINUTES',
+                        help='minutes between runs of a job, e.g. rain=30')
+    parser.add_argument('--once', action='store_true', help='run the jobs once and exit')
+    parser.add_argument('--workers', type=int, default=None, help='requests in flight (IMS_CONCURRENCY or 8)')
+    parser.add_argument('--status', action='store_true', help='print the status file, exit 1 if unhealthy')
+    parser.add_argument('--stale', type=int, default=30, help='minutes without a heartbeat that --status reports')
+    args = parser.parse_args()
+    if args.status:
+        if os.path.exists(status_path()):
+            with open(status_path()) as f:
+                print(f.read())
+        problems = check(stale=args.stale)
+        print('\n'.join(problems) if problems else 'healthy')
+        sys.exit(1 if problems else 0)
+    unknown = [name for name in args.jobs if name not in JOBS]
+    if unknown:
+        parser.error(f"unknown jobs {', '.join(unknown)}, choose from {', '.join(JOBS)}")
+    every = {name: minutes for name, (minutes, _, _) in JOBS.items()}
+    for item in args.every:
+        name, _, minutes = item.partition('=')
+        if name not in JOBS or not minutes.isdigit() or int(minutes) == 0:
+            parser.error(f'bad --every {item}, expected JOB=MINUTES')
+        every[name] = int(minutes)
+    sys.exit(0 if run(args.jobs, every, concurrency=args.workers, once=args.once) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+fetch.py
+
+Concurrent fetch engine for IMS API queries.
+
+The query functions in weather.py block on HTTP, so every call runs in a worker
+thread while an asyncio loop (running in a background thread) bounds the number
+of requests in flight. The pace of the requests is set by the client's token bucket,
+shared by every process that calls the API (ratelimit.py, IMS_SHARED_RATE).
+
+Usage:
+    with FetchEngine(concurrency=16) as engine:
+        for kwargs, data in engine.map(query_rain, calls):
+            ...
+"""
+import os
+import random
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# default, override with the env var on cron machines
+CONCURRENCY = int(os.environ.get('IMS_CONCURRENCY', 8))
+
+
+class AdaptiveBackoff:
+    """
+    Delay shared by all workers of a job: every failure doubles it (up to max_delay), every
+    success halves it, so the workers back off together while the API struggles and speed up
+    again as soon as it answers. Thread safe, used from the worker threads.
+
+    Inputs:
+        min_delay (float): Delay after the first failure, in seconds. Default is 0.2.
+        max_delay (float): Upper bound for the delay, in seconds. Default is 10.
+    """
+    def __init__(self, min_delay=0.2, max_delay=10.0):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            delay = self.delay
+        if delay > 0:
+            time.sleep(delay * random.uniform(0.75, 1.25))
+
+    def success(self):
+        with self.lock:
+            self.delay = self.delay / 2 if self.delay > self.min_delay else 0.0
+
+    def failure(self):
+        with self.lock:
+            self.delay = min(self.max_delay, max(self.min_delay, self.delay * 2))
+
+
+class FetchEngine:
+    """
+    Runs blocking query calls concurrently.
+
+    Inputs:
+        concurrency (int): Maximum number of requests in flight. Default from IMS_CONCURRENCY (8).
+    """
+    def __init__(self, concurrency=None):
+        self.concurrency = max(1, int(concurrency or CONCURRENCY))
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.semaphore = asyncio.run_coroutine_threadsafe(self._make_semaphore(), self.loop).result()
+
+    async def _make_semaphore(self):
+        return asyncio.Semaphore(self.concurrency)
+
+    async def _call(self, func, kwargs):
+        async with self.semaphore:
+            return await self.loop.run_in_executor(self.executor, lambda: func(**kwargs))
+
+    def submit(self, func, **kwargs):
+        """
+        Schedules func(**kwargs) and returns a concurrent.futures.Future with its result.
+        """
+        return asyncio.run_coroutine_threadsafe(self._call(func, kwargs), self.loop)
+
+    def map(self, func, calls, window=None):
+        """
+        Runs func(**kwargs) for every kwargs dict in calls and yields (kwargs, result) in the
+        order of calls. At most `window` results are held ahead of the consumer, so memory
+        stays bounded however long calls is. A call that raises yields None as its result.
+
+        Inputs:
+            func (callable): Blocking function, e.g. weather.query_rain.
+            calls (iterable of dict): Keyword arguments for each call.
+            window (int): Number of calls scheduled ahead. Default is 2 * concurrency.
+
+        Outputs:
+            generator of (dict, any): Each call's kwargs and result.
+        """
+        window = window or 2 * self.concurrency
+        pending = []
+        calls = iter(calls)
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < window:
+                try:
+                    kwargs = next(calls)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append((kwargs, self.submit(func, **kwargs)))
+            if not pending:
+                break
+            kwargs, future = pending.pop(0)
+            try:
+                result = future.result()
+            except Exception as err:
+                print(f'\nquery failed for {kwargs}: {err}')
+                result = None
+            yield kwargs, result
+
+    async def _cancel_pending(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        # calls still queued when the consumer stops early (e.g. a crash mid-run) are cancelled
+        asyncio.run_coroutine_threadsafe(self._cancel_pending(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def fetch_many(func, calls, concurrency=None):
+    """
+    Runs func(**kwargs) for every kwargs dict in calls concurrently.
+
+    Inputs:
+        func (callable): Blocking query function.
+        calls (list of dict): Keyword arguments for each call.
+        concurrency (int): Maximum number of requests in flight.
+
+    Outputs:
+        list: Results in the same order as calls (None for calls that raised).
+    """
+    with FetchEngine(concurrency=concurrency) as engine:
+        return [result for _, result in engine.map(func, calls)]
@@ -2,6 +2,7 @@ import os
 import pandas as pd
 from glob import glob
 import numpy as np
+from store import read_year
 '''
 Create data/station_monthly.csv from data/rain_*.csv, data/temp_min_*.csv, data/temp_max_*.csv
 '''
@@ -37,13 +38,10 @@ def process_files(file_pattern, measure_name, agg_func):
     for file in files:
         print(f"  Reading {file}...")
         try:
-            df = pd.read_csv(file)
+            df = read_year(file, parse_dates=True)
             if df.empty:
                 continue
             
-            # Ensure datetime
-            df['datetime'] = pd.to_datetime(df['datetime'])
-            
             # Assign Cycle
             # Vectorized cycle assignment is faster
             if measure_name in ['Rain', 'MinTemp']:
@@ -114,10 +112,8 @@ def process_mean_files():
         if not os.path.exists(max_file):
             continue
         try:
-            df_min = pd.read_csv(min_file)
-            df_max = pd.read_csv(max_file)
-            df_min['datetime'] = pd.to_datetime(df_min['datetime'])
-            df_max['datetime'] = pd.to_datetime(df_max['datetime'])
+            df_min = read_year(min_file, parse_dates=True)
+            df_max = read_year(max_file, parse_dates=True)
 
             common_stations = [c for c in df_min.columns
                                if c != 'datetime' and c in df_max.columns]
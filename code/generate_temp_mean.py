@@ -7,6 +7,7 @@ For each station and day:
 Then for each (year, month):
     - mean of daily midranges across days in that month -> per-station monthly value
     - median across stations belonging to the same region -> regional value
+      (regions.py, the medians of all years at once)
 
 The "Cycle" in the output is simply the calendar year (e.g. "2024"),
 so that the HTML chart can display Jan-Dec on the x-axis.
@@ -16,59 +17,32 @@ import sys
 import pandas as pd
 import numpy as np
 from glob import glob
+from store import read_year
+from regions import region_index, region_codes, regional_medians, stack
 
 # Setup paths so we can run from any directory
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-# Load station data for region mapping
-df_stations = pd.read_csv(os.path.join(base_dir, 'data', 'ims_stations.csv'))
-
-# Regional mapping (matching temp_per_month.py)
-regions = {
-    'יהודה ושומרון': 7,
-    'גליל וגולן': 8,
-    'עמקי הצפון': 9,
-    'ים המלח והערבה': 10,
-    'כרמל וחיפה': 11,
-    'נגב': 12,
-    'גוש דן והשרון': 13,
-    'מישור חוף דרומי': 14,
-    'מישור חוף צפוני': 15,
-}
-
-# Fix regional overrides based on station name (matching temp_per_month.py)
-fix = {
-    'EDEN FARM 20080706': 'עמקי הצפון',
-    'HAIFA PORT': 'מישור חוף צפוני',
-    'ROSH HANIQRA_1m': 'מישור חוף צפוני',
-    'AFEQ_1m': 'מישור חוף צפוני',
-    'GILGAL_1m': 'ים המלח והערבה',
-    'ASHDOD PORT_1m': 'מישור חוף דרומי'
-}
-
-for station_name, region_name in fix.items():
-    idx = df_stations[df_stations['name'] == station_name].index
-    if not idx.empty:
-        df_stations.at[idx[0], 'regionId'] = regions[region_name]
+# Region of every station (see regions.py)
+index = region_index(os.path.join(base_dir, 'data', 'ims_stations.csv'))
 
 
 def process_year(year):
     """
-    Process one year: compute monthly mean midrange per station,
-    then median across region, returning a list of dicts.
+    Process one year: compute monthly mean midrange per station.
+
+    Returns ((cycle, month) of every month, stations, months x stations values),
+    or None if the year is skipped.
     """
     min_file = os.path.join(base_dir, 'data', f'temp_min_{year}.csv')
     max_file = os.path.join(base_dir, 'data', f'temp_max_{year}.csv')
 
     if not os.path.exists(min_file) or not os.path.exists(max_file):
         print(f"  Skipping {year}: missing min or max file")
-        return []
-
-    df_min = pd.read_csv(min_file)
-    df_max = pd.read_csv(max_file)
+        return None
 
-    df_min['datetime'] = pd.to_datetime(df_min['datetime'])
-    df_max['datetime'] = pd.to_datetime(df_max['datetime'])
+    df_min = read_year(min_file, parse_dates=True)
+    df_max = read_year(max_file, parse_dates=True)
 
     # Station columns (exclude datetime)
     min_stations = [c for c in df_min.columns if c != 'datetime']
@@ -77,7 +51,7 @@ def process_year(year):
 
     if not common_stations:
         print(f"  Skipping {year}: no common stations")
-        return []
+        return None
 
     # Resample to daily: min of TDmin, max of TDmax
     df_min = df_min.set_index('datetime')
@@ -89,37 +63,21 @@ def process_year(year):
     # Daily midrange per station
     daily_mid = (daily_min + daily_max) / 2.0
 
-    # Add month and year columns
-    daily_mid['_month'] = daily_mid.index.month
-    daily_mid['_year'] = daily_mid.index.year
-
-    results = []
-
-    for (yr, month), group in daily_mid.groupby(['_year', '_month']):
-        cycle = str(yr)
-
-        # Monthly mean of daily midranges per station
-        station_values = group[common_stations].mean()
-
-        if station_values.isna().all():
-            continue
+    # Monthly mean of daily midranges per station, summed station by station over the days
+    # with a value, as DataFrame.mean does
+    values = daily_mid.to_numpy()
+    keys = daily_mid.index.year * 100 + daily_mid.index.month
+    months, start = np.unique(keys, return_index=True)
+    means = []
+    for lo, hi in zip(start, list(start[1:]) + [len(values)]):
+        part = values[lo:hi]
+        count = (~np.isnan(part)).sum(axis=0)
+        total = np.ascontiguousarray(np.where(np.isnan(part), 0.0, part).T).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means.append(np.where(count > 0, total / count, np.nan))
 
-        for region_name, rid in regions.items():
-            region_stations = df_stations[df_stations['regionId'] == rid]['name'].tolist()
-            available = [s for s in region_stations if s in common_stations]
-
-            if available:
-                region_vals = station_values[available].dropna()
-                if not region_vals.empty:
-                    median_val = region_vals.median()
-                    results.append({
-                        'Region': region_name,
-                        'Cycle': cycle,
-                        'Month': month,
-                        'Temp': round(float(median_val), 1)
-                    })
-
-    return results
+    cycles = [(str(key // 100), int(key % 100)) for key in months]
+    return cycles, common_stations, np.array(means).reshape(len(cycles), len(common_stations))
 
 
 def main():
@@ -129,10 +87,26 @@ def main():
     years = [int(os.path.basename(f).replace('temp_min_', '').replace('.csv', ''))
              for f in min_files]
 
-    all_results = []
+    parts = []
     for year in years:
         print(f"Processing {year}...")
-        all_results.extend(process_year(year))
+        part = process_year(year)
+        if part is not None:
+            parts.append(part)
+
+    # Median across the stations of every region, of all months of all years at once
+    rows, stations, values, _ = stack(parts)
+    medians = regional_medians(values, region_codes(stations, index))
+    all_results = []
+    for row, (cycle, month) in enumerate(rows):
+        for region_name, (median, found) in medians.items():
+            if found[row]:
+                all_results.append({
+                    'Region': region_name,
+                    'Cycle': cycle,
+                    'Month': month,
+                    'Temp': round(float(median[row]), 1)
+                })
 
     if not all_results:
         print("No results generated.")
@@ -0,0 +1,282 @@
+"""
+ims_fake.py
+
+Local stand-in for the IMS Envista API, for benchmarks and runs without network or token.
+
+Serves the endpoints weather.py uses:
+    /v1/envista/stations
+    /v1/envista/regions
+    /v1/envista/stations/{id}/data?from=YYYY/MM/DD&to=YYYY/MM/DD             (all channels)
+    /v1/envista/stations/{id}/data/{channel}?from=YYYY/MM/DD&to=YYYY/MM/DD
+    /v1/envista/stations/{id}/data[/{channel}]/daily/YYYY/MM/DD
+    /v1/envista/stations/{id}/data[/{channel}]/monthly/YYYY/MM
+    /v1/envista/stations/{id}/data[/{channel}]/earliest
+    /v1/envista/stations/{id}/data[/{channel}]/latest
+
+Station and region metadata come from data/ims_stations.csv and data/ims_regions.csv,
+earliest/latest from data/ims_activity.csv. Data records are synthetic: every value is a
+deterministic function of (station, channel, time), so overlapping windows, single and
+all-channel queries always agree. If record_dir points at a response cache (see cache.py),
+recorded bodies are served instead where available.
+
+Failure modes of the real API can be injected: latency, error.png pages and empty bodies.
+
+Usage:
+    python code/ims_fake.py --port 8765 --latency 0.2 --error-rate 0.1 --empty-rate 0.05
+    IMS_API_URL=http://127.0.0.1:8765/v1/envista python code/rain_update.py
+"""
+import re
+import ast
+import csv
+import sys
+import json
+import time
+import random
+import argparse
+import functools
+import threading
+import numpy as np
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from cache import ResponseCache
+
+ERROR_PAGE = b'<html><body><img src="error.png"></body></html>'
+DATA_PATH = re.compile(r'^/v1/envista/stations/(\d+)/data(?:/(\d+))?(?:/(daily|monthly|earliest|latest)((?:/\d+)*))?/?$')
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf8') as f:
+        return list(csv.DictReader(f))
+
+
+def _typed(value):
+    """Turns a CSV cell back into the JSON value the API returned for it."""
+    if value in ['True', 'False']:
+        return value == 'True'
+    if value[:1] in ['{', '[']:
+        return ast.literal_eval(value)
+    if re.fullmatch(r'-?\d+', value):
+        return int(value)
+    return value
+
+
+def synthetic_values(stationid, channelid, name, minutes):
+    """
+    Deterministic values for one channel.
+
+    Inputs:
+        stationid (int), channelid (int), name (str): Channel identity.
+        minutes (numpy.ndarray): Minutes since 2000-01-01 of each record.
+
+    Outputs:
+        (numpy.ndarray, numpy.ndarray): values, status (1 valid, 2 invalid).
+    """
+    seed = (stationid * 1000 + channelid) * 2654435761
+    x = ((minutes.astype(np.uint64) * np.uint64(2246822519) + np.uint64(seed % 2**32)) % np.uint64(2**32)) / 2**32
+    day = minutes / 1440.0
+    season = np.cos(2 * np.pi * (day - 200) / 365.25)
+    diurnal = np.cos(2 * np.pi * (minutes % 1440 - 840) / 1440)
+    if name.startswith('Rain'):
+        values = np.where(x > 0.97, np.round((x - 0.97) * 100, 1), 0.0)
+        values = np.where(season < 0, 0.0, values)
+    elif name.startswith('TD') or name in ['TG', 'TW']:
+        values = np.round(20 - 8 * season + 5 * diurnal + 2 * x, 1)
+    elif name == 'RH':
+        values = np.round(60 + 15 * season - 15 * diurnal + 10 * x, 0)
+    elif name == 'Grad':
+        values = np.round(np.maximum(0, 900 * diurnal - 200 * season) * x, 0)
+    elif name.startswith('WD'):
+        values = np.round(360 * x, 0)
+    else:
+        values = np.round(8 * x, 1)
+    status = np.where(x < 0.005, 2, 1)
+    return values, status
+
+
+class FakeIMS:
+    """
+    Payload builder behind the server.
+
+    Inputs:
+        data_dir (str): Directory with ims_stations.csv, ims_regions.csv and ims_activity.csv.
+        record_dir (str): Response cache directory to serve recorded bodies from. Default is None.
+    """
+    def __init__(self, data_dir='data', record_dir=None):
+        self.stations = [{k: _typed(v) for k, v in row.items()} for row in _read_csv(f'{data_dir}/ims_stations.csv')]
+        self.regions = [{k: _typed(v) for k, v in row.items()} for row in _read_csv(f'{data_dir}/ims_regions.csv')]
+        self.by_id = {sta['stationId']: sta for sta in self.stations}
+        self.activity = {int(row['stationId']): row for row in _read_csv(f'{data_dir}/ims_activity.csv')}
+        self.recorded = ResponseCache(root=record_dir, offline=True) if record_dir else None
+        self.respond = functools.lru_cache(maxsize=256)(self.respond)
+
+    def records(self, stationid, channelid, start, end):
+        """
+        Data records in [start, end) in the API layout.
+        """
+        station = self.by_id[stationid]
+        monitors = [m for m in station['monitors'] if channelid is None or m['channelId'] == channelid]
+        step = station['timebase'] if isinstance(station['timebase'], int) and station['timebase'] > 0 else 10
+        epoch = datetime(2000, 1, 1)
+        first = int((start - epoch).total_seconds() // 60)
+        first += (-first) % step
+        minutes = np.arange(first, int((end - epoch).total_seconds() // 60), step)
+        columns = []
+        for m in monitors:
+            values, status = synthetic_values(stationid, m['channelId'], m['name'], minutes)
+            columns.append((m, values.tolist(), status.tolist()))
+        data = []
+        for irec, minute in enumerate(minutes.tolist()):
+            stamp = (epoch + timedelta(minutes=minute)).strftime('%Y-%m-%dT%H:%M:%S+02:00')
+            channels = [{'id': m['channelId'], 'name': m['name'], 'alias': None, 'value': values[irec],
+                         'status': status[irec], 'valid': True, 'description': None}
+                        for m, values, status in columns]
+            data.append({'datetime': stamp, 'channels': channels})
+        return data
+
+    def respond(self, url):
+        """
+        Outputs:
+            (int, bytes): HTTP status and body for a request path with its query string.
+                          The last 256 bodies are kept, so repeated benchmark runs measure
+                          the client rather than payload generation.
+        """
+        if self.recorded is not None:
+            body = self.recorded.get(url)
+            if body is not None:
+                return 200, body
+        parts = urlsplit(url)
+        path = parts.path.lower()
+        query = parse_qs(parts.query)
+        if path.rstrip('/') == '/v1/envista/stations':
+            return 200, json.dumps(self.stations).encode('utf8')
+        if path.rstrip('/') == '/v1/envista/regions':
+            return 200, json.dumps(self.regions).encode('utf8')
+        match = DATA_PATH.match(path)
+        if match is None:
+            return 404, b'not found'
+        stationid = int(match.group(1))
+        channelid = int(match.group(2)) if match.group(2) else None
+        kind = match.group(3)
+        parts = [int(p) for p in (match.group(4) or '').split('/') if p]
+        if stationid not in self.by_id:
+            return 404, b'no such station'
+        if kind in ['earliest', 'latest']:
+            stamp = self.activity.get(stationid, {}).get(kind, '')
+            if not stamp:
+                return 200, b''
+            t = datetime.fromisoformat(stamp[:19])
+            data = self.records(stationid, channelid, t, t + timedelta(minutes=60))[:1]
+            for d in data:
+                d['datetime'] = stamp
+        elif kind == 'daily':
+            start = datetime(*parts[:3]) if len(parts) >= 3 else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            data = self.records(stationid, channelid, start, min(start + timedelta(days=1), datetime.now()))
+        elif kind == 'monthly':
+            start = datetime(parts[0], parts[1], 1)
+            end = datetime(parts[0] + parts[1] // 12, parts[1] % 12 + 1, 1)
+            data = self.records(stationid, channelid, start, min(end, datetime.now()))
+        else:
+            start = datetime.strptime(query['from'][0], '%Y/%m/%d')
+            end = datetime.strptime(query['to'][0], '%Y/%m/%d') + timedelta(days=1)
+            data = self.records(stationid, channelid, start, min(end, datetime.now()))
+        return 200, json.dumps({'stationId': stationid, 'data': data}).encode('utf8')
+
+
+def start_server(port=0, latency=0.0, error_rate=0.0, empty_rate=0.0, data_dir='data', record_dir=None, seed=0):
+    """
+    Starts the stand-in server in a background thread.
+
+    Inputs:
+        port (int): Port to listen on, 0 picks a free one.
+        latency (float): Seconds added to every response.
+        error_rate (float): Fraction of data responses replaced by an error.png page.
+        empty_rate (float): Fraction of data responses replaced by an empty body.
+        data_dir (str): Directory with the metadata CSVs.
+        record_dir (str): Response cache directory to serve recorded bodies from.
+        seed (int): Seed of the failure injection.
+
+    Outputs:
+        (ThreadingHTTPServer, str): The server (call .shutdown() to stop) and its base url,
+                                    to be used as IMS_API_URL.
+    """
+    fake = FakeIMS(data_dir=data_dir, record_dir=record_dir)
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            path = urlsplit(self.path).path.lower()
+            time.sleep(latency)
+            with lock:
+                draw = rng.random()
+            if '/data' in path and draw < error_rate:
+                status, body = 200, ERROR_PAGE
+            elif '/data' in path and draw < error_rate + empty_rate:
+                status, body = 200, b''
+            else:
+                status, body = fake.respond(self.path)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 128  # the default backlog of 5 stalls connects at high concurrency
+
+    server = Server(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/v1/envista'
+
+
+def start_process(port=8765, latency=0.0, error_rate=0.0, empty_rate=0.0):
+    """
+    Starts the stand-in server in a subprocess, so it doesn't compete with the client for
+    the GIL (use this for benchmarks).
+
+    Outputs:
+        (subprocess.Popen, str): The process (call .terminate() to stop) and its base url.
+    """
+    import subprocess
+    import requests
+    process = subprocess.Popen([sys.executable, __file__, '--port', str(port), '--latency', str(latency),
+                                '--error-rate', str(error_rate), '--empty-rate', str(empty_rate)],
+                               stdout=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}/v1/envista'
+    for _ in range(100):
+        try:
+            requests.get(f'{url}/regions', timeout=1)
+            break
+        except requests.RequestException:
+            time.sleep(0.1)
+    return process, url
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the IMS Envista API.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of error.png responses')
+    parser.add_argument('--empty-rate', type=float, default=0.0, help='fraction of empty responses')
+    parser.add_argument('--record-dir', default=None, help='serve recorded responses from this cache directory')
+    args = parser.parse_args()
+    server, url = start_server(port=args.port, latency=args.latency, error_rate=args.error_rate,
+                               empty_rate=args.empty_rate, record_dir=args.record_dir)
+    print(f'serving fake IMS API, use IMS_API_URL={url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+journal.py
+
+Checkpoint journal of a collector run.
+
+The collectors (rain_1h, temp_1h, monitor_1h, multi_1h in weather.py) keep the output frame
+in memory and write the CSV once at the end. Every station column is appended to a small
+journal as soon as it is binned, so a run that crashes can be resumed: the next run replays
+the journal into the frame and only queries the stations that are still missing. The journal
+is removed once the CSV is written.
+
+One JSON line per station, with the non-empty rows of its column:
+
+    {"station": "AVNE ETAN", "first": "2025-01-01 00:00", "rows": [12, 13], "values": [0.2, 1.4]}
+    {"station": "ZEMAH", "first": "2025-01-01 00:00", "rows": null, "values": null}   (no valid data)
+
+A crash can leave the last line without its newline. Reading skips a line that doesn't parse,
+and appending (open_log) first cuts the file back to its last complete line, so the next
+entry starts a line of its own.
+
+Settings (env vars):
+    IMS_JOURNAL_DIR   Journal directory. Default is data/cache/journal.
+"""
+import os
+import json
+import numpy as np
+
+
+def _complete(f):
+    # length of a binary file up to the end of its last complete line
+    stop = f.seek(0, os.SEEK_END)
+    while stop > 0:
+        start = max(0, stop - (1 << 16))
+        f.seek(start)
+        newline = f.read(stop - start).rfind(b'\n')
+        if newline >= 0:
+            return start + newline + 1
+        stop = start
+    return 0
+
+
+def open_log(path):
+    """
+    Opens a JSON lines file for appending, cut back to its last complete line.
+
+    Outputs:
+        file: The file, opened in text mode 'a'.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        with open(path, 'r+b') as f:
+            f.truncate(_complete(f))
+    return open(path, 'a')
+
+
+class Journal:
+    """
+    Inputs:
+        csv_path (str): Output CSV of the run, the journal is named after it.
+        root (str): Journal directory. Default from IMS_JOURNAL_DIR (data/cache/journal).
+    """
+    def __init__(self, csv_path, root=None):
+        root = root or os.environ.get('IMS_JOURNAL_DIR', 'data/cache/journal')
+        name = os.path.normpath(csv_path).replace(os.sep, '__')
+        self.path = os.path.join(root, name + '.jsonl')
+        self.file = None
+
+    def replay(self, df):
+        """
+        Adds the journaled columns that df doesn't have yet.
+
+        Inputs:
+            df (pandas.DataFrame): Hourly frame with a 'datetime' column, modified in place.
+
+        Outputs:
+            set: Stations already collected in the interrupted run, with or without data.
+        """
+        done = set()
+        if not os.path.exists(self.path):
+            return done
+        first = df['datetime'].values[0] if len(df) else None
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # line cut short by a crash
+                if entry['first'] != first:
+                    continue
+                station = entry['station']
+                done.add(station)
+                if entry['rows'] is None or station in df.columns:
+                    continue
+                rows = np.array(entry['rows'], dtype=int)
+                keep = rows < len(df)
+                column = np.full(len(df), np.nan)
+                column[rows[keep]] = np.array(entry['values'], dtype=float)[keep]
+                df[station] = column
+        if len(done):
+            msg = f'resuming {len(done)} stations from {self.path}'
+            print(f'\r{msg:<80}')
+        return done
+
+    def add(self, station, df):
+        """
+        Appends one station.
+
+        Inputs:
+            station (str): Station name.
+            df (pandas.DataFrame): Frame holding the station's new column. A station without
+                                   a column is journaled as having no valid data.
+        """
+        if self.file is None:
+            self.file = open_log(self.path)
+        entry = {'station': station, 'first': df['datetime'].values[0], 'rows': None, 'values': None}
+        if station in df.columns:
+            values = df[station].values
+            rows = np.flatnonzero(~np.isnan(values))
+            entry.update(rows=rows.tolist(), values=values[rows].tolist())
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+
+    def close(self):
+        """
+        Removes the journal, call after the CSV has been written.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
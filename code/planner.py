@@ -0,0 +1,186 @@
+"""
+planner.py
+
+The API workload of a run, computed before running it: every request the update engine
+(update_engine.py) or a backfill (backfill.py) would make, as (station, channel, window), with
+its estimated bytes and time from the requests recorded so far (costs.py). Nothing is fetched.
+
+The update's requests come from its own planning step (plan_update): the active stations of
+data/ims_activity.csv, the monitors of every station in data/ims_stations.csv, the watermarks
+and the columns the yearly files already have. A backfill's are its month units still missing
+from its ledger (plan_backfill).
+
+Requests of one station often cover the same days for several monitors (the update's gaps all
+end today, a backfill's months are the same for every monitor). The channels of a station that
+are queried over overlapping windows can be fetched with a single all-channels request over
+their union instead (query_station, as multi_1h does). The deduplicated plan takes it wherever
+its estimated time is lower than the separate requests'.
+
+A run's time is the requests' time over the concurrency, but not less than their number over
+the request rate (IMS_SHARED_RATE). It is printed for a few concurrencies, to size
+--workers. The station-days queried are compared with the same monitors collected from the
+start of the year, to see that an update is incremental.
+
+Usage (from the repository root):
+    python code/planner.py Rain TDmin TDmax              # the next update of these monitors
+    python code/planner.py RH WS --year 2025             # an update of a past year
+    python code/planner.py Grad RH --backfill 2010 2025  # a backfill
+    python code/planner.py Rain --list run               # every request, as the run makes them
+    python code/planner.py Rain TDmin --list merged      # the deduplicated requests
+    python code/planner.py Rain --csv plan.csv
+"""
+import argparse
+import pandas as pd
+from datetime import datetime
+import ratelimit
+from costs import Costs
+from backfill import plan_backfill
+from update_engine import MONITORS, plan_update
+
+CONCURRENCIES = [1, 2, 4, 8, 16, 32]
+
+
+def _days(from_date, to_date):
+    return (datetime.strptime(to_date, '%Y-%m-%d') - datetime.strptime(from_date, '%Y-%m-%d')).days + 1
+
+
+def update_requests(monitors, year=None):
+    """
+    Outputs:
+        (list, int): The requests of update(monitors, year), dicts of monitor, station, channel,
+                     from_date and to_date, and the station-days of the same files collected
+                     whole, from January 1.
+    """
+    files, calls, to_date = plan_update(monitors, year)
+    year = int(year or datetime.now().year)
+    full = sum(len(columns) for _, _, columns, _ in files.values()) * _days(f'{year}-01-01', to_date)
+    return calls, full
+
+
+def backfill_requests(monitors, from_year, to_year, stations=None):
+    """
+    Outputs:
+        list: The requests of a backfill of every monitor, as in update_requests.
+    """
+    requests = []
+    for monitor in monitors:
+        for _, station, channel, _, from_date, to_date in plan_backfill(monitor, from_year, to_year, stations)[2]:
+            requests.append({'monitor': monitor, 'station': station, 'channel': channel,
+                             'from_date': from_date, 'to_date': to_date})
+    return requests
+
+
+def estimate(requests, costs=None):
+    """
+    Inputs:
+        requests (list): Requests as returned by update_requests, 'channel' None for all channels.
+        costs (Costs): Recorded costs. Default is the saved ones.
+
+    Outputs:
+        pandas.DataFrame: A row per request, with its days, estimated bytes and seconds.
+    """
+    costs = costs or Costs()
+    rows = []
+    for request in requests:
+        days = _days(request['from_date'], request['to_date'])
+        nbytes, seconds = costs.estimate('channel' if request['channel'] else 'all', days)
+        rows.append({**request, 'days': days, 'bytes': nbytes, 'seconds': seconds})
+    columns = ['monitor', 'station', 'channel', 'from_date', 'to_date', 'days', 'bytes', 'seconds']
+    return pd.DataFrame(rows, columns=columns)
+
+
+def deduplicate(plan, costs=None):
+    """
+    Replaces the requests of a station whose windows overlap with one all-channels request over
+    their union, where its estimated time is lower.
+
+    Inputs:
+        plan (pandas.DataFrame): As returned by estimate.
+        costs (Costs): Recorded costs. Default is the saved ones.
+
+    Outputs:
+        pandas.DataFrame: The deduplicated plan, a merged request has channel None and the
+                          monitors it covers joined by '+'.
+    """
+    costs = costs or Costs()
+    rows = []
+    for _, requests in plan.sort_values(['station', 'from_date'], kind='stable').groupby('station', sort=False):
+        # groups of requests whose windows overlap, in from_date order
+        groups = []
+        for request in requests.to_dict('records'):
+            if groups and request['from_date'] <= max(r['to_date'] for r in groups[-1]):
+                groups[-1].append(request)
+            else:
+                groups.append([request])
+        for group in groups:
+            if len(group) > 1:
+                from_date = group[0]['from_date']
+                to_date = max(r['to_date'] for r in group)
+                days = _days(from_date, to_date)
+                nbytes, seconds = costs.estimate('all', days)
+                if seconds < sum(r['seconds'] for r in group):
+                    rows.append({'monitor': '+'.join(r['monitor'] for r in group), 'station': group[0]['station'],
+                                 'channel': None, 'from_date': from_date, 'to_date': to_date, 'days': days,
+                                 'bytes': nbytes, 'seconds': seconds})
+                    continue
+            rows.extend(group)
+    return pd.DataFrame(rows, columns=plan.columns)
+
+
+def run_seconds(plan, concurrency):
+    """
+    Outputs:
+        float: Estimated time of a plan's requests with concurrency requests in flight.
+    """
+    return max(plan['seconds'].sum() / concurrency, len(plan) / ratelimit.RATE if ratelimit.RATE > 0 else 0)
+
+
+def summary(plan, name):
+    text = f'{name}: {len(plan)} requests, {plan["days"].sum()} station-days, {plan["bytes"].sum() / 2**20:.1f} MB'
+    return text + ', ' + ' '.join(f'{c}:{run_seconds(plan, c):.0f}s' for c in CONCURRENCIES) + ' (workers:time)'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List and cost the API requests of a run before running it.')
+    parser.add_argument('monitors', nargs='+', help=f"monitor names: {', '.join(MONITORS)}")
+    parser.add_argument('--year', type=int, default=None, help='year of the update, default the current year')
+    parser.add_argument('--backfill', nargs=2, type=int, metavar=('FROM_YEAR', 'TO_YEAR'),
+                        help='plan a backfill of these years instead of an update')
+    parser.add_argument('--list', choices=['run', 'merged'], help='print every request of the run or the merged plan')
+    parser.add_argument('--csv', help='save the merged plan to a CSV')
+    args = parser.parse_args()
+    unknown = [monitor for monitor in args.monitors if monitor not in MONITORS]
+    if unknown:
+        parser.error(f"unknown monitors {', '.join(unknown)}, choose from {', '.join(MONITORS)}")
+    costs = Costs()
+    full = None
+    if args.backfill:
+        requests = backfill_requests(args.monitors, *args.backfill)
+    else:
+        requests, full = update_requests(args.monitors, args.year)
+    plan = estimate(requests, costs)
+    merged = deduplicate(plan, costs)
+    for kind, other in [('channel', 'all'), ('all', 'channel')]:
+        if costs.recorded(kind):
+            print(f'{kind} requests: estimated from {costs.recorded(kind)} recorded')
+        elif costs.recorded(other):
+            print(f'{kind} requests: none recorded, scaled from the {other} requests')
+        else:
+            print(f'{kind} requests: none recorded, rough defaults')
+    print(summary(plan, 'run'))
+    print(summary(merged, 'merged'))
+    if full:
+        print(f'incremental: {plan["days"].sum()} of {full} station-days since January 1 '
+              f'({100 * plan["days"].sum() / full:.1f}%)')
+    if args.list:
+        listed = plan if args.list == 'run' else merged
+        listed = listed.assign(channel=listed['channel'].fillna('(all)'), bytes=listed['bytes'].round().astype(int),
+                               seconds=listed['seconds'].round(2))
+        print(listed.to_string(index=False))
+    if args.csv:
+        merged.assign(bytes=merged['bytes'].round().astype(int), seconds=merged['seconds'].round(3)).to_csv(args.csv, index=False)
+        print(f'saved {args.csv}')
+
+
+if __name__ == '__main__':
+    main()
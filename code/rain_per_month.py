@@ -9,40 +9,12 @@ from datetime import datetime
 # Setup paths
 home = os.environ['HOME']
 sys.path.append(f'{home}/weather/code')
-from weather import round_data
-
-# Load station data for region mapping
-df_stations = pd.read_csv('data/ims_stations.csv')
-
-# Regional mapping from user
-regions = {
-    'יהודה ושומרון': 7,
-    'גליל וגולן': 8,
-    'עמקי הצפון': 9,
-    'ים המלח והערבה': 10,
-    'כרמל וחיפה': 11,
-    'נגב': 12,
-    'גוש דן והשרון': 13,
-    'מישור חוף דרומי': 14,
-    'מישור חוף צפוני': 15,
-}
-
-# Fix regional overrides based on station name
-fix = {
-    'EDEN FARM 20080706': 'עמקי הצפון',
-    'HAIFA PORT': 'מישור חוף צפוני',
-    'ROSH HANIQRA_1m': 'מישור חוף צפוני',
-    'AFEQ_1m': 'מישור חוף צפוני',
-    'GILGAL_1m': 'ים המלח והערבה',
-    'GILGAL': 'ים המלח והערבה',
-    'ASHDOD PORT_1m': 'מישור חוף דרומי'
-}
-
-# Apply fixes to df_stations
-for station_name, region_name in fix.items():
-    idx = df_stations[df_stations['name'] == station_name].index
-    if not idx.empty:
-        df_stations.at[idx[0], 'regionId'] = regions[region_name]
+from cube import open_cube
+from store import read_rain
+from regions import RAIN_FIXES, region_index, region_codes, regional_medians, stack
+
+# Region of every station (see regions.py)
+index = region_index(fixes=RAIN_FIXES)
 
 # Output file
 output_file = 'data/regional_rain_per_month.csv'
@@ -66,61 +38,86 @@ def get_winter_and_month_for_date(year, month):
         return f"{year-1}-{year}", month
 
 
-def load_winter_data(winter_name):
-    """Load combined rain data for a winter season."""
+_cube = []
+
+
+def load_winter_data(winter_name, months=None):
+    """
+    Monthly rain sums of a winter season, from the rain cube for the whole season or from the
+    season's two yearly files for some months.
+
+    Inputs:
+        winter_name (str): Winter, e.g. '2024-2025'.
+        months (list): Months to sum. Default is all, read from the rain cube (--force, which
+                       sums every winter), otherwise only the winter's files are read, which
+                       doesn't build the cube on a checkout without one.
+
+    Outputs:
+        (list, list, numpy.ndarray) or None: The months with hours in the files, the stations
+            with a column in the winter's files and their sums (months x stations, NaN for no
+            rain), or None if the winter's first file is missing.
+    """
     year_start, year_end = map(int, winter_name.split('-'))
     
-    prev_file = f'data/rain_{year_start}.csv'
-    curr_file = f'data/rain_{year_end}.csv'
-    
-    if not os.path.exists(prev_file):
+    if not os.path.exists(f'data/rain_{year_start}.csv'):
         return None
-    
-    df_prev = pd.read_csv(prev_file)
-    df_prev['datetime'] = pd.to_datetime(df_prev['datetime'])
-    
-    if os.path.exists(curr_file) and year_start != year_end:
-        df_curr = pd.read_csv(curr_file)
-        df_curr['datetime'] = pd.to_datetime(df_curr['datetime'])
+    # the stations of the Sept 1 to Sept 1 slice across the two years
+    from_date, to_date = f'{year_start}-09-01', f'{year_end}-09-01'
+    if months is None:
+        if not _cube:
+            _cube.append(open_cube('rain'))
+        cube = _cube[0]
+        stations = cube.present(from_date, to_date)
+
+        def take(start, stop):
+            return cube.exact(cube.take(stations, start, stop))
     else:
-        df_curr = pd.DataFrame(columns=df_prev.columns)
-        df_curr['datetime'] = pd.to_datetime(df_curr['datetime'])
-    
-    df_sep_dec = df_prev[df_prev['datetime'] >= f'{year_start}-09-01']
-    df_jan_aug = df_curr[df_curr['datetime'] < f'{year_end}-09-01']
-    
-    return pd.concat([df_sep_dec, df_jan_aug])
-
-
-def compute_month_data(df_winter, m, winter_name):
-    """Compute regional rain data for a specific month."""
-    df_month = df_winter[df_winter['datetime'].dt.month == m]
-    
-    if df_month.empty:
-        return []
-    
+        df = read_rain(None, from_date, to_date)
+        stations = list(df.columns[1:])
+        hours = df['datetime'].to_numpy(dtype=str)
+        season = df[stations].to_numpy()
+
+        def take(start, stop):
+            return season[np.searchsorted(hours, start):np.searchsorted(hours, stop)]
+    found, sums = [], []
+    for m in months or target_months:
+        year = get_year_from_winter_and_month(winter_name, m)
+        values = take(f'{year}-{m:02d}-01', f'{year + m // 12}-{m % 12 + 1:02d}-01')
+        if len(values) == 0:
+            continue
+        # summed station by station over its hours, NaN as 0, as DataFrame.sum(min_count=1) does
+        total = np.ascontiguousarray(np.where(np.isnan(values), 0.0, values).T).sum(axis=1)
+        total[np.isnan(values).all(axis=0)] = np.nan
+        found.append(m)
+        sums.append(total)
+    return found, stations, np.array(sums).reshape(len(found), len(stations))
+
+
+def compute_month_data(winters):
+    """
+    Regional rain of every month of winters, the medians of all of them computed at once.
+
+    Inputs:
+        winters (dict): Winter name -> its load_winter_data.
+
+    Outputs:
+        list: Dicts of Region, Winter, Year, Month and Rain, for every month and every region
+              with a station in the winter's files.
+    """
+    rows, stations, values, present = stack([([(winter_name, m) for m in months], columns, sums)
+                                             for winter_name, (months, columns, sums) in winters.items()])
+    # median of the stations with rain > 0 in each region (0 if none)
+    medians = regional_medians(values, region_codes(stations, index), present=present, positive=True)
     results = []
-    stations = [col for col in df_month.columns if col != 'datetime']
-    monthly_sums = df_month[stations].sum(skipna=True, min_count=1)
-    
-    year = get_year_from_winter_and_month(winter_name, m)
-    
-    for region_name, rid in regions.items():
-        region_stations = df_stations[df_stations['regionId'] == rid]['name'].tolist()
-        available_stations = [s for s in region_stations if s in monthly_sums.index]
-        
-        if available_stations:
-            region_station_sums = monthly_sums[available_stations].fillna(0)
-            if not region_station_sums.empty:
-                # Compute median only for stations with rain > 0
-                positive_sums = region_station_sums[region_station_sums > 0]
-                median_rain = positive_sums.median() if not positive_sums.empty else 0.0
+    for row, (winter_name, m) in enumerate(rows):
+        for region_name, (median, found) in medians.items():
+            if found[row]:
                 results.append({
                     'Region': region_name,
                     'Winter': winter_name,
-                    'Year': year,
+                    'Year': get_year_from_winter_and_month(winter_name, m),
                     'Month': m,
-                    'Rain': round(float(median_rain), 1)
+                    'Rain': round(float(median[row]), 1)
                 })
     return results
 
@@ -139,19 +136,6 @@ def update_month_in_df(df_existing, new_data, winter, month):
     return df_existing
 
 
-def process_winter(winter_name):
-    """Process all months for a given winter season."""
-    df_winter = load_winter_data(winter_name)
-    if df_winter is None:
-        return []
-    
-    winter_results = []
-    for m in target_months:
-        month_data = compute_month_data(df_winter, m, winter_name)
-        winter_results.extend(month_data)
-    return winter_results
-
-
 def main():
     parser = argparse.ArgumentParser(description='Update regional rain per month data.')
     parser.add_argument('-f', '--force', action='store_true', help='Force recomputation even if no new data')
@@ -190,23 +174,25 @@ def main():
         years = sorted([int(f.split('_')[1].split('.')[0]) for f in rain_files])
         winters = [f"{years[i]}-{years[i+1]}" for i in range(len(years)-1)]
         
-        all_results = []
+        data = {}
         for w in winters:
             print(f"Processing winter {w}...")
-            all_results.extend(process_winter(w))
+            winter_data = load_winter_data(w)
+            if winter_data is not None:
+                data[w] = winter_data
         
-        df_existing = pd.DataFrame(all_results)
+        df_existing = pd.DataFrame(compute_month_data(data))
         updated = True
     else:
         # Load winter data for previous and current months
-        df_prev_winter = load_winter_data(prev_winter)
-        df_curr_winter = load_winter_data(current_winter)
+        df_prev_winter = load_winter_data(prev_winter, [prev_m])
+        df_curr_winter = load_winter_data(current_winter, [curr_m])
 
         updated = False
 
         # Check and update previous month
         if df_prev_winter is not None:
-            new_prev_data = compute_month_data(df_prev_winter, prev_m, prev_winter)
+            new_prev_data = compute_month_data({prev_winter: df_prev_winter})
             
             # Compare with existing data
             existing_prev = df_existing[(df_existing['Winter'] == prev_winter) & 
@@ -233,7 +219,7 @@ def main():
 
         # Check and add current month
         if df_curr_winter is not None:
-            new_curr_data = compute_month_data(df_curr_winter, curr_m, current_winter)
+            new_curr_data = compute_month_data({current_winter: df_curr_winter})
             
             existing_curr = df_existing[(df_existing['Winter'] == current_winter) & 
                                          (df_existing['Month'] == curr_m)]
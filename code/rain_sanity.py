@@ -4,6 +4,7 @@ import sys
 from datetime import datetime
 sys.path.append(os.environ['HOME']+'/weather/code')
 from weather import rain_1h, update_stations
+from cube import open_cube
 import numpy as np
 
 station = 'METZOKE DRAGOT'
@@ -25,28 +26,12 @@ if False:
         winters.append(total)
         df_prev = df
 
+cube = open_cube('rain')
 winters = []
-for year in range(2015, 2027):
-    df = pd.read_csv(f'data/rain_{year}.csv')
-    # half2: Jan 1 to Sept 1 of current year
-    df2 = df[df['datetime'] < f'{year}-09-01']
-    # half2 = np.nansum(df[station][df['datetime'] < f'{year}-09-01'])
-    
-    if year == 2015:
-        df_prev = df
-        continue
-    
-    # half1: Sept 1 of previous year to Jan 1 of current year
-    df1 = df_prev[df_prev['datetime'] >= f'{year-1}-09-01']
-    # half1 = np.nansum(df_prev[station][df_prev['datetime'] >= f'{year-1}-09-01'])
-    df_combined = pd.concat([df1, df2])
-    idate = np.where(np.array([md[5:10] for md in df_combined['datetime']]) == '01-03')[0][-1]
-    month_day_okay = np.array([False]*len(df_combined))
-    month_day_okay[:idate+1] = True
-    df_combined = df_combined[month_day_okay]
-    total = np.nansum(df_combined[station])
+for year in range(2016, 2027):
+    # Sept 1 of previous year through Jan 3 of current year, one slice of the cube
+    total = np.nansum(cube.exact(cube.take([station], f'{year-1}-09-01', f'{year}-01-04')))
     winters.append(total)
-    df_prev = df
 
 print(winters[-1]/np.median(winters[:-1]))
 
@@ -56,7 +41,7 @@ df_stations = pd.read_csv('data/ims_stations.csv')
 df_stations = df_stations[df_stations['regionId'] == 12]
 fall = np.zeros((11, 4))
 for iyear, year in enumerate(range(2015, 2026)):
-    df = pd.read_csv(f'data/rain_{year}.csv')
+    df = cube.frame(from_date=f'{year}-01-01', to_date=f'{year+1}-01-01')
     #filter stations
     keep_columns = [True] + [s in df_stations['name'].tolist() for s in df.columns[1:]]
     df = df.iloc[:, keep_columns]
@@ -66,7 +51,7 @@ for iyear, year in enumerate(range(2015, 2026)):
         fall[iyear, imonth] = np.median(np.nansum(df_month.values[:, 1:], 0))
 winter = np.zeros((11, 8))
 for iyear, year in enumerate(range(2016, 2027)):
-    df = pd.read_csv(f'data/rain_{year}.csv')
+    df = cube.frame(from_date=f'{year}-01-01', to_date=f'{year+1}-01-01')
     #filter stations
     keep_columns = [True] + [s in df_stations['name'].tolist() for s in df.columns[1:]]
     df = df.iloc[:, keep_columns]
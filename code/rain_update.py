@@ -1,93 +1,26 @@
 import os
 import pandas as pd
 import sys
-from datetime import datetime
 sys.path.append(os.environ['HOME']+'/weather/code')
 if os.path.exists('/home/yuval'):
     os.chdir('/home/yuval/weather')
-from weather import rain_1h, update_stations, update_activity, round_data
-import numpy as np
+from weather import update_stations, update_activity, client
+from registry import station_registry
+from update_engine import update
 update_stations()
 # update_activity()
-#get current year
 
-current_year = datetime.now().year
-y = str(current_year)
-m = str(datetime.now().month).zfill(2)
-d = str(datetime.now().day).zfill(2)
-opcsv = f'data/rain_{y}.csv'
-if not os.path.exists(opcsv):
-    df_rain = rain_1h(from_date=f'{y}-01-01', to_date=f'{y}-{m}-{d}', save_csv=opcsv)
-else:
-    df_sta = pd.read_csv('data/ims_stations.csv')
-    df_act = pd.read_csv('data/ims_activity.csv')
-    df_rain = pd.read_csv(opcsv)
-    latest = df_act['latest'].max()[:10]
-    not_in_act_list = [sta for sta in df_sta['stationId'].tolist() if sta not in df_act['stationId'].tolist()]
-    if len(not_in_act_list) > 0:
-        print(f'Warning: Stations {not_in_act_list} are not in activity list (may be discontinued). Skipping.')
-    still_active = df_act[df_act['latest'] >= latest]['stationId'].tolist()
-    for ista in range(len(still_active)):
-        idsta = still_active[ista]
-        sta = df_sta['name'][df_sta['stationId'] == idsta].values[0]
-        if sta in df_rain.columns:
-            last = np.where(~df_rain[sta].isna())[0]
-            if len(last) == 0:  # no rain yet, maybe no successful read yet
-                last = df_rain['datetime'][0][:10]
-            else:
-                last = df_rain['datetime'][last[-1]][:10]
-            df_rain_new = rain_1h(stations=[sta], from_date=last, to_date=f'{y}-{m}-{d}', save_csv=False)
-            if df_rain_new['datetime'].iloc[-1] > df_rain['datetime'].iloc[-1]:
-                istart = np.where(df_rain_new['datetime'] == df_rain['datetime'].iloc[-1])[0][0] + 1
-                for irow in range(istart, len(df_rain_new)):
-                    df_rain.at[len(df_rain), 'datetime'] = df_rain_new.at[irow, 'datetime']
-            if sta in df_rain_new.columns and df_rain_new[sta].notna().any():
-                for row_new in np.where(~df_rain_new[sta].isna())[0]:
-                    row = np.where(df_rain['datetime'] == df_rain_new.at[row_new, 'datetime'])[0]
-                    if len(row) == 0:
-                        raise ValueError('Datetime mismatch when updating rain data')
-                    df_rain.at[row[0], sta] = df_rain_new.at[row_new, sta]
-        else:
-            df_rain_new = rain_1h(stations=[sta], from_date=f'{y}-01-01', to_date=f'{y}-{m}-{d}', save_csv=False)
-            if df_rain_new['datetime'].iloc[-1] > df_rain['datetime'].iloc[-1]:
-                istart = np.where(df_rain_new['datetime'] == df_rain['datetime'].iloc[-1])[0][0] + 1
-                for irow in range(istart, len(df_rain_new)):
-                    df_rain.at[len(df_rain), 'datetime'] = df_rain_new.at[irow, 'datetime']
-            monitor = df_sta['monitors'][df_sta['name'].values == sta].values[0]
-            if 'Rain' in monitor:
-                df_rain[sta] = np.nan  # maybe someplace in the desert, no rain so far
-            if sta in df_rain_new.columns:
-                for row_new in np.where(~df_rain_new[sta].isna())[0]:
-                    row = np.where(df_rain['datetime'] == df_rain_new.at[row_new, 'datetime'])[0]
-                    if len(row) == 0:
-                        raise ValueError('Datetime mismatch when updating rain data')
-                    df_rain.at[row[0], sta] = df_rain_new.at[row_new, sta]
-        print(f'\rUpdated rain data for station {ista+1} of {len(still_active)}: {sta}', end='', flush=True)
-print('saving rain update')
-df_rain.to_csv(opcsv, index=False)
-print('rounding rain data')
-round_data(opcsv)
-current_year = datetime.now().year
-winters = pd.read_csv('data/sum_rain_sep_to_aug.csv')
-for year in [current_year-1, current_year]:
-    df = pd.read_csv(f'data/rain_{year}.csv')
-    # half2: Jan 1 to Sept 1 of current year
-    df2 = df[df['datetime'] < f'{year}-09-01']
-    # half2 = np.nansum(df[station][df['datetime'] < f'{year}-09-01'])
-    
-    if year == current_year-1:
-        df_prev = df
-        continue
-    # half1: Sept 1 of previous year to Jan 1 of current year
-    df1 = df_prev[df_prev['datetime'] >= f'{year-1}-09-01']
-    df_combined = pd.concat([df1, df2])
-    for station in df_combined.columns[1:]:
-        total = np.nansum(df_combined[station])
-        winters.at[len(winters)-1, station] = total
-    df_prev = df
-winters.to_csv('data/sum_rain_sep_to_aug.csv', index=False)
-round_data('data/sum_rain_sep_to_aug.csv')
+reg = station_registry()
+act_ids = set(pd.read_csv('data/ims_activity.csv')['stationId'])
+not_in_act_list = [sta for sta in reg.names if sta not in act_ids]
+if len(not_in_act_list) > 0:
+    print(f'Warning: Stations {not_in_act_list} are not in activity list (may be discontinued). Skipping.')
+# the gap of every active station with a rain channel, from its watermark (see update_engine.py)
+update(['Rain'])
+print(f'IMS API: {client.report()}')
+# the winter totals (data/sum_rain_sep_to_aug.csv) were brought up to date with the new hours by
+# the update, python code/seasons.py --verify compares them with a full recompute
 '''TODO: 
 - try complete past data
 - collect min max temp
-'''
\ No newline at end of file
+'''
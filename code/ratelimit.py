@@ -0,0 +1,129 @@
+"""
+ratelimit.py
+
+Token bucket shared by every process that calls the IMS API.
+
+The cron jobs (rain_update.py, temp_update.py, monitor_update.py, ...) may overlap, and each
+runs its queries concurrently, so pacing inside one process doesn't bound the load the API
+sees. The bucket's state lives in a small JSON file per host, and every request takes a token
+under an exclusive fcntl lock on that file:
+
+    data/cache/ratelimit/api.ims.gov.il.json
+        {"tokens": 3.2, "stamp": 1760000000.1, "requests": 5120, "waited": 812,
+         "wait_seconds": 96.4, "max_wait": 1.9}
+
+Tokens refill at `rate` per second up to `burst`. A caller that finds the bucket empty
+reserves the next token (the count goes negative) and sleeps outside the lock until it is
+due, so callers are served in order and the lock is held for microseconds. The counters
+accumulate over all processes, use read_state() to look at them.
+
+Without fcntl (Windows) the bucket is shared by the threads of one process only.
+
+Settings (env vars):
+    IMS_SHARED_RATE    Requests per second for all processes together, 0 disables. Default is 10.
+    IMS_SHARED_BURST   Requests that may start at once after a quiet period. Default is 20.
+    IMS_RATE_DIR       Directory of the state files. Default is data/cache/ratelimit.
+"""
+import os
+import json
+import time
+import threading
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+RATE = float(os.environ.get('IMS_SHARED_RATE', 10))
+BURST = float(os.environ.get('IMS_SHARED_BURST', 20))
+
+
+class TokenBucket:
+    """
+    Inputs:
+        host (str): API host, one bucket per host.
+        rate (float): Tokens per second. Default from IMS_SHARED_RATE (10).
+        burst (float): Bucket size. Default from IMS_SHARED_BURST (20).
+        root (str): Directory of the state files. Default from IMS_RATE_DIR (data/cache/ratelimit).
+    """
+    def __init__(self, host, rate=None, burst=None, root=None):
+        self.rate = RATE if rate is None else rate
+        self.burst = max(1.0, BURST if burst is None else burst)
+        root = root or os.environ.get('IMS_RATE_DIR', 'data/cache/ratelimit')
+        self.path = os.path.join(root, f'{host}.json')
+        self.lock = threading.Lock()
+        self.fd = None
+
+    def _open(self):
+        if self.fd is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self.fd
+
+    def _read(self, fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        raw = b''
+        while True:
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                break
+            raw += chunk
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return {}  # new file, or cut short by a crash: start with a full bucket
+
+    def _write(self, fd, state):
+        raw = json.dumps(state).encode('utf8')
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, raw)
+        os.ftruncate(fd, len(raw))
+
+    def acquire(self):
+        """
+        Takes one token, sleeping until it is due.
+
+        Outputs:
+            float: Seconds waited.
+        """
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            fd = self._open()
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                state = self._read(fd)
+                now = time.time()
+                tokens = min(self.burst, state.get('tokens', self.burst)
+                             + (now - state.get('stamp', now)) * self.rate)
+                wait = max(0.0, (1 - tokens) / self.rate)
+                state['tokens'] = tokens - 1
+                state['stamp'] = now
+                state['requests'] = state.get('requests', 0) + 1
+                if wait > 0:
+                    state['waited'] = state.get('waited', 0) + 1
+                    state['wait_seconds'] = state.get('wait_seconds', 0.0) + wait
+                    state['max_wait'] = max(state.get('max_wait', 0.0), wait)
+                self._write(fd, state)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def read_state(self):
+        """
+        Outputs:
+            dict: Current state and counters of the bucket, empty if it was never used.
+        """
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,147 @@
+"""
+records.py
+
+Streaming decode of IMS data responses.
+
+A year of 10 minute data is ~52k records per channel, and an all-channels response carries
+every channel in every record. Decoding the whole body with json.loads keeps the bytes and
+the full tree of dicts alive at once. RecordDecoder is fed the body in chunks instead: it
+finds the 'data' array, decodes the complete records of every chunk as one small batch, and
+keeps only the hour and value of valid records (valid flag set, status 1) of the wanted
+channels. Peak memory per request is then about one chunk plus the compact result.
+
+orjson is used for the batches when installed, json otherwise.
+
+Usage:
+    decoder = RecordDecoder()                       # single channel query
+    for chunk in response.iter_content(1 << 16):
+        decoder.feed(chunk)
+    records = decoder.close()                       # Records, or None if the body has no data
+
+    decoder = RecordDecoder(channels=['Rain', 'TDmax'])   # all-channels query
+    ...
+    decoder.close()['TDmax']
+"""
+import re
+import json
+import numpy as np
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+DATA_START = re.compile(rb'"data"\s*:\s*\[')
+RECORD_START = b'{"datetime"'
+
+
+class Records:
+    """
+    Valid records of one channel.
+
+    Inputs:
+        hours (numpy.ndarray): datetime64[h] of every record (the hour it falls in).
+        values (numpy.ndarray): float64 value of every record.
+        last (str or None): Full datetime of the newest valid record, as sent by the API
+                            (e.g. '2025-10-07T12:50:00+03:00').
+    """
+    def __init__(self, hours, values, last=None):
+        self.hours = hours
+        self.values = values
+        self.last = last
+
+    def __len__(self):
+        return len(self.values)
+
+
+class RecordDecoder:
+    """
+    Incremental decoder of the 'data' array of a response body.
+
+    Inputs:
+        channels (list of str or None): Channel names to keep from every record, the first
+                                        channel of each name (like weather.split_channels).
+                                        None keeps the first channel of every record, for
+                                        single channel queries.
+    """
+    def __init__(self, channels=None):
+        self.channels = channels
+        self.buffer = b''
+        self.started = False
+        self.hours = {name: [] for name in (channels or [None])}
+        self.values = {name: [] for name in (channels or [None])}
+        self.last = {name: None for name in (channels or [None])}
+
+    def feed(self, chunk):
+        """
+        Decodes the records completed by chunk.
+
+        Inputs:
+            chunk (bytes): Next piece of the body.
+        """
+        self.buffer += chunk
+        if not self.started:
+            match = DATA_START.search(self.buffer)
+            if match is None:
+                return
+            self.started = True
+            self.buffer = self.buffer[match.end():]
+        # everything before the last record start is a run of complete records
+        last = self.buffer.rfind(RECORD_START)
+        if last > 0:
+            batch = self.buffer[:last].rstrip().rstrip(b',')
+            self.buffer = self.buffer[last:]
+            self._add(loads(b'[' + batch + b']'))
+
+    def close(self):
+        """
+        Decodes the rest of the body.
+
+        Outputs:
+            Records, dict or None: Records of the channel (single channel), dict of channel
+                                   name -> Records (channels given), or None if the body is
+                                   JSON without data.
+
+        Raises:
+            ValueError: If the body is not a complete JSON response, e.g. an error page or a
+                        truncated transfer.
+        """
+        if not self.started:
+            body = loads(self.buffer)
+            if isinstance(body, dict) and body.get('data') is None:
+                return None
+            raise ValueError('response has no data array')
+        # the last record(s) and the closing bracket of the array, anything after it is ignored
+        rest, _ = json.JSONDecoder().raw_decode('[' + self.buffer.decode('utf8'))
+        self._add(rest)
+        self.buffer = b''
+        result = {name: Records(np.array(self.hours[name], dtype='datetime64[h]'),
+                                np.array(self.values[name], dtype=float), self.last[name])
+                  for name in self.hours}
+        return result if self.channels else result[None]
+
+    def _add(self, records):
+        if self.channels is None:
+            hours = self.hours[None]
+            values = self.values[None]
+            last = None
+            for d in records:
+                channel = d['channels'][0]
+                if channel['valid'] == True and channel['status'] == 1 and channel['value'] is not None:
+                    last = d['datetime']
+                    hours.append(last[:13])
+                    values.append(channel['value'])
+            if last is not None:
+                self.last[None] = last
+            return
+        for d in records:
+            seen = set()
+            for channel in d['channels']:
+                name = channel['name']
+                if name not in self.hours or name in seen:
+                    continue
+                seen.add(name)
+                if channel['valid'] == True and channel['status'] == 1 and channel['value'] is not None:
+                    self.hours[name].append(d['datetime'][:13])
+                    self.values[name].append(channel['value'])
+                    self.last[name] = d['datetime']
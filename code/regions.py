@@ -0,0 +1,129 @@
+"""
+regions.py
+
+The regions of the regional files (regional_rain_per_month.csv and
+regional_temp_{min,max,mean}_per_month.csv), shared by rain_per_month.py, temp_per_month.py and
+generate_temp_mean.py: the region of every station, and the median over the stations of every
+region of a whole matrix of per-station values at once.
+
+A station's region is its regionId in data/ims_stations.csv, except for the few stations that
+FIXES moves. The rain file moves GILGAL as well (RAIN_FIXES), as it always has.
+
+Usage:
+    index = region_index()                                   # station -> region id
+    codes = region_codes(stations, index)                    # region id of every column
+    medians = regional_medians(values, codes)                # months x stations -> per region
+    keys, stations, values, present = stack([(months, stations, values), ...])   # seasons at once
+"""
+import numpy as np
+import pandas as pd
+
+STATIONS_CSV = 'data/ims_stations.csv'
+
+# region name (as in the regional files) -> regionId
+REGIONS = {
+    'יהודה ושומרון': 7,
+    'גליל וגולן': 8,
+    'עמקי הצפון': 9,
+    'ים המלח והערבה': 10,
+    'כרמל וחיפה': 11,
+    'נגב': 12,
+    'גוש דן והשרון': 13,
+    'מישור חוף דרומי': 14,
+    'מישור חוף צפוני': 15,
+}
+
+# regional overrides based on station name
+FIXES = {
+    'EDEN FARM 20080706': 'עמקי הצפון',
+    'HAIFA PORT': 'מישור חוף צפוני',
+    'ROSH HANIQRA_1m': 'מישור חוף צפוני',
+    'AFEQ_1m': 'מישור חוף צפוני',
+    'GILGAL_1m': 'ים המלח והערבה',
+    'ASHDOD PORT_1m': 'מישור חוף דרומי'
+}
+RAIN_FIXES = {**FIXES, 'GILGAL': 'ים המלח והערבה'}
+
+
+def region_index(path=STATIONS_CSV, fixes=FIXES):
+    """
+    Inputs:
+        path (str): Stations CSV. Default is data/ims_stations.csv.
+        fixes (dict): Station name -> region name overrides. Default is FIXES.
+
+    Outputs:
+        dict: Station name -> regionId.
+    """
+    df_stations = pd.read_csv(path, usecols=['name', 'regionId'])
+    index = dict(zip(df_stations['name'], df_stations['regionId']))
+    for station_name, region_name in fixes.items():
+        if station_name in index:
+            index[station_name] = REGIONS[region_name]
+    return index
+
+
+def region_codes(stations, index):
+    """
+    Outputs:
+        numpy.ndarray: regionId of every station, 0 for a station the index doesn't have.
+    """
+    return np.array([index.get(name, 0) for name in stations], dtype=int)
+
+
+def stack(parts):
+    """
+    One matrix of the rows of several matrices over different stations, e.g. the months of
+    every season.
+
+    Inputs:
+        parts (list): (row keys, stations, rows x stations values) of every matrix.
+
+    Outputs:
+        (list, list, numpy.ndarray, numpy.ndarray): The row keys, the stations in order of first
+            appearance, the values (NaN where a row's matrix lacks a station) and the mask of the
+            stations every row's matrix has.
+    """
+    stations = list(dict.fromkeys(name for _, names, _ in parts for name in names))
+    column = {name: col for col, name in enumerate(stations)}
+    keys = [key for part_keys, _, _ in parts for key in part_keys]
+    values = np.full((len(keys), len(stations)), np.nan)
+    present = np.zeros(values.shape, dtype=bool)
+    row = 0
+    for part_keys, names, part in parts:
+        cols = [column[name] for name in names]
+        values[row:row + len(part_keys), cols] = part
+        present[row:row + len(part_keys), cols] = True
+        row += len(part_keys)
+    return keys, stations, values, present
+
+
+def regional_medians(values, codes, present=None, positive=False):
+    """
+    Median over the stations of every region, for every row of a matrix.
+
+    Inputs:
+        values (numpy.ndarray): rows (e.g. months) x stations.
+        codes (numpy.ndarray): regionId of every station, see region_codes.
+        present (numpy.ndarray): rows x stations mask of the stations a row has. Default is the
+                                 stations with a value.
+        positive (bool): If True, the median of the values > 0 only, 0 for a region whose
+                         stations have none (rain, NaN counts as 0). Default is False.
+
+    Outputs:
+        dict: Region name -> (median of every row, mask of the rows where the region has a
+              station), for every region of REGIONS.
+    """
+    if present is None:
+        present = ~np.isnan(values)
+    medians = {}
+    for region_name, rid in REGIONS.items():
+        columns = codes == rid
+        found = present[:, columns].any(axis=1)
+        part = values[:, columns]
+        part = np.where(part > 0, part, np.nan) if positive else part
+        median = np.full(len(values), 0.0 if positive else np.nan)
+        valued = ~np.isnan(part).all(axis=1)
+        if valued.any():
+            median[valued] = np.nanmedian(part[valued], axis=1)
+        medians[region_name] = (median, found)
+    return medians
@@ -0,0 +1,147 @@
+"""
+registry.py
+
+Station registry: data/ims_stations.csv parsed once into plain lookups.
+
+The monitors column holds the python repr of the API's monitor list. It is parsed once with
+ast.literal_eval and the result is kept in a JSON sidecar (data/cache/ims_stations.json)
+together with the CSV's mtime and size, so later runs skip the parsing until the CSV changes
+(e.g. after weather.update_stations).
+
+Usage:
+    reg = station_registry()
+    reg.ids['AVNE ETAN']                 # 2
+    reg.names[2]                         # 'AVNE ETAN'
+    reg.channel('AVNE ETAN', 'TDmax')    # 9, None if the station has no such monitor
+    reg.regions['AVNE ETAN']             # 8
+    reg.locations['AVNE ETAN']           # (32.8174, 35.7622)
+"""
+import os
+import ast
+import csv
+import json
+from cache import _write_atomic
+
+STATIONS_CSV = 'data/ims_stations.csv'
+
+
+class StationRegistry:
+    """
+    Inputs:
+        rows (list of dict): One dict per station with keys stationId, name, regionId, timebase,
+                             location (dict or None) and monitors (list of dict).
+
+    Attributes (all keyed by station name unless noted, in the CSV's station order):
+        ids (dict): name -> stationId
+        names (dict): stationId -> name
+        channels (dict): name -> {monitor name: channelId}, first channel of each name
+        monitors (dict): name -> list of monitor dicts as in the API
+        regions (dict): name -> regionId
+        locations (dict): name -> (latitude, longitude), None if unknown
+        timebase (dict): name -> minutes between records
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.ids = {}
+        self.names = {}
+        self.channels = {}
+        self.monitors = {}
+        self.regions = {}
+        self.locations = {}
+        self.timebase = {}
+        for row in rows:
+            name = row['name']
+            self.ids[name] = row['stationId']
+            self.names[row['stationId']] = name
+            self.monitors[name] = row['monitors']
+            channels = {}
+            for m in row['monitors']:
+                channels.setdefault(m['name'], m['channelId'])
+            self.channels[name] = channels
+            self.regions[name] = row['regionId']
+            location = row['location']
+            if isinstance(location, dict) and 'latitude' in location:
+                self.locations[name] = (location['latitude'], location['longitude'])
+            else:
+                self.locations[name] = None
+            self.timebase[name] = row['timebase']
+
+    def channel(self, station, monitor):
+        """
+        Outputs:
+            int or None: Channel id of monitor at station, None if the station doesn't have it.
+        """
+        return self.channels[station].get(monitor)
+
+    def has(self, station, *monitors):
+        """
+        Outputs:
+            bool: True if the station has any of the monitors.
+        """
+        channels = self.channels.get(station, {})
+        return any(m in channels for m in monitors)
+
+
+def _number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def _literal(value):
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return None
+
+
+def parse_stations(path=STATIONS_CSV):
+    """
+    Outputs:
+        list of dict: One typed dict per row of the stations CSV.
+    """
+    with open(path, newline='', encoding='utf8') as f:
+        return [{'stationId': int(row['stationId']),
+                 'name': row['name'],
+                 'regionId': _number(row['regionId']),
+                 'timebase': _number(row['timebase']),
+                 'location': _literal(row['location']),
+                 'monitors': _literal(row['monitors']) or []}
+                for row in csv.DictReader(f)]
+
+
+_loaded = {}
+
+
+def station_registry(path=STATIONS_CSV, sidecar=None):
+    """
+    Registry of the stations CSV, reloaded only when the CSV changes.
+
+    Inputs:
+        path (str): Stations CSV. Default is data/ims_stations.csv.
+        sidecar (str): Parsed copy of the CSV. Default from IMS_REGISTRY (data/cache/ims_stations.json).
+
+    Outputs:
+        StationRegistry
+    """
+    sidecar = sidecar or os.environ.get('IMS_REGISTRY', 'data/cache/ims_stations.json')
+    stat = os.stat(path)
+    stamp = [stat.st_mtime_ns, stat.st_size]
+    key = os.path.abspath(path)
+    if key in _loaded and _loaded[key][0] == stamp:
+        return _loaded[key][1]
+    rows = None
+    try:
+        with open(sidecar) as f:
+            saved = json.load(f)
+        if saved['csv'] == key and saved['stamp'] == stamp:
+            rows = saved['rows']
+    except (OSError, ValueError, KeyError):
+        pass
+    if rows is None:
+        rows = parse_stations(path)
+        _write_atomic(sidecar, json.dumps({'csv': key, 'stamp': stamp, 'rows': rows}).encode('utf8'))
+    registry = StationRegistry(rows)
+    _loaded[key] = (stamp, registry)
+    return registry
@@ -4,6 +4,7 @@ import sys
 from datetime import datetime
 sys.path.append(os.environ['HOME']+'/weather/code')
 from weather import rain_1h, update_stations
+from store import read_year
 import numpy as np
 import unittest
 from glob import glob
@@ -12,7 +13,7 @@ class TestRain(unittest.TestCase):
     def dates_unique(self):
         passed = np.zeros(len(rain_years), bool)
         for iyear, year in enumerate(rain_years):
-            rain = pd.read_csv(f'data/rain_{year}.csv')
+            rain = read_year(f'data/rain_{year}.csv')
             passed[iyear] = len(rain['datetime'].unique()) == len(rain)
         if not np.all(passed):
             print(f'Rain files do not have unique dates: {rain_years[~passed]}')
@@ -21,7 +22,7 @@ class TestRain(unittest.TestCase):
     def dates_sequential(self):
         passed = np.zeros(len(rain_years), bool)
         for iyear, year in enumerate(rain_years):
-            rain = pd.read_csv(f'data/rain_{year}.csv')
+            rain = read_year(f'data/rain_{year}.csv')
             diff = pd.to_datetime(rain['datetime']).diff()
             passed[iyear] = len(np.unique(diff.values[1:])) == 1
         if not np.all(passed):
@@ -31,7 +32,7 @@ class TestRain(unittest.TestCase):
         passed = np.zeros(len(rain_years), bool)
         current_year = datetime.now().year
         for iyear, year in enumerate(rain_years):
-            rain = pd.read_csv(f'data/rain_{year}.csv')
+            rain = read_year(f'data/rain_{year}.csv')
             start_ok = rain['datetime'][0] == str(year)+'-01-01 00:00'
             end_ok = (year == current_year) or (rain['datetime'].iloc[-1] == str(year)+'-12-31 23:00')
             passed[iyear] = start_ok and end_ok
@@ -46,7 +47,7 @@ class TestStations(unittest.TestCase):
     def stations_unique(self):
         passed = np.zeros(len(rain_years), bool)
         for iyear, year in enumerate(rain_years):
-            rain = pd.read_csv(f'data/rain_{year}.csv')
+            rain = read_year(f'data/rain_{year}.csv')
             passed[iyear] = len(rain.columns[1:].unique()) == len(rain.columns[1:])
         if not np.all(passed):
             print(f'Rain files do not have unique stations: {rain_years[~passed]}')
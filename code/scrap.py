@@ -3,6 +3,8 @@ os.chdir(os.environ['HOME']+'/weather')
 import sys
 sys.path.append(os.environ['HOME']+'/weather/code')
 from weather import *
+from weather import df_sta
+from registry import station_registry
 import numpy as np
 ims_api_token = os.environ.get('IMS_API_TOKEN')
 headers = {'Authorization': 'ApiToken '+ims_api_token}
@@ -27,7 +29,7 @@ ii = np.where(df_sta['name'].values == 'TEL YOSEF')[0][0]
 stationid = df_sta.at[ii, 'stationId']
 name = df_sta.at[ii, 'name']
 monitors = df_sta.at[ii, 'monitors']
-mnt = eval(monitors)
+mnt = station_registry().monitors[name]
 channels = [m['channelId'] for m in mnt if m['name'] in ['Grad', 'TD', 'RH', 'WS']]
 from_date = '2025-10-07'
 to_date = '2025-10-10'
@@ -0,0 +1,224 @@
+"""
+seasons.py
+
+Seasonal summaries of the yearly hourly CSVs, one row per season and one column per station:
+
+    data/sum_rain_sep_to_aug.csv   rain total of every winter (September to August)
+    data/min_temp_sep_to_aug.csv   lowest TDmin of every winter
+    data/max_temp_mar_to_feb.csv   highest TDmax of every summer (March to February)
+
+A season is labeled by its two years, '2025-2026', and has a row for every yearly file but the
+first one, as generate_rain_files.py and generate_temp_files.py build them (recompute).
+
+The update engine keeps them current from the hours it has just merged (update_seasons), at a
+cost that depends on the new hours only: the rain of an hour is added to the total of its
+season, and a new minimum (maximum) replaces the season's when it beats it. A revised hour is
+handled too: its old rain is taken off the total, and an extreme that was revised away is
+recomputed for its station alone. A season without a row yet (the first hours of a new yearly
+file) is computed whole once. Both read only the season's one or two yearly files (through
+their store mirrors), a full recompute reads every season from the cube (cube.py).
+
+Usage (from the repository root):
+    python code/seasons.py             # recompute the three files
+    python code/seasons.py --verify    # compare them with a full recompute
+"""
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from store import rain_totals, read_year
+from cube import open_cube, year_files
+from weather_data import round_data
+
+# yearly file prefix, aggregation, first month and label column of every summary
+SUMMARIES = {'sum_rain_sep_to_aug': ('rain', 'sum', 9, 'winter'),
+             'min_temp_sep_to_aug': ('temp_min', 'min', 9, 'winter'),
+             'max_temp_mar_to_feb': ('temp_max', 'max', 3, 'summer')}
+
+
+def summary_path(name):
+    return f'data/{name}.csv'
+
+
+def season_labels(hours, month):
+    """
+    Outputs:
+        numpy.ndarray: Label of the season of every hour ('YYYY-MM-DD HH:MM'), e.g. '2025-2026'.
+    """
+    hours = np.asarray(hours, dtype=str)
+    years = hours.astype('U4').astype(int)
+    months = np.array([h[5:7] for h in hours], dtype=int)
+    first = years - (months < month)
+    return np.char.add(np.char.add(first.astype(str), '-'), (first + 1).astype(str))
+
+
+def season_values(name, label, stations=None, cube=None):
+    """
+    Summary of one season computed from the hourly files.
+
+    Inputs:
+        name (str): Summary, a key of SUMMARIES.
+        label (str): Season, e.g. '2025-2026'.
+        stations (list): Stations to compute. Default is every station with a column in the
+                         season's files.
+        cube (cube.Cube): The prefix's cube, to read the season from. Default is None: the
+                          season's yearly files are read, as an update does for one season.
+
+    Outputs:
+        pandas.Series: Value per station, in the order of the files or of the cube (NaN for a
+                       station without values, 0 rain for a station without rain).
+    """
+    prefix, aggregation, month, _ = SUMMARIES[name]
+    first = int(label[:4])
+    from_date, to_date = f'{first}-{month:02d}-01', f'{first + 1}-{month:02d}-01'
+    if aggregation == 'sum':
+        # summed over the rainy hours only
+        totals = rain_totals(from_date, to_date)
+        return totals if stations is None else totals[[sta for sta in totals.index if sta in stations]]
+    # fmin/fmax skip NaN like np.nanmin/np.nanmax, without a warning for a station without values
+    reduce = np.fmin if aggregation == 'min' else np.fmax
+    if cube is not None:
+        present = cube.present(from_date, to_date)
+        if stations is not None:
+            present = [sta for sta in present if sta in stations]
+        values = cube.exact(reduce.reduce(cube.take(present, from_date, to_date), axis=0))
+        return pd.Series(dict(zip(present, values)), dtype=float)
+    values = {}
+    for year in [first, first + 1]:
+        path = f'data/{prefix}_{year}.csv'
+        if not os.path.exists(path):
+            continue
+        df = read_year(path)
+        hours = df['datetime'].to_numpy(dtype=str)
+        # rows past the file's year are the next file's, as in the cube
+        start = np.searchsorted(hours, max(from_date, f'{year}-01-01'))
+        stop = np.searchsorted(hours, min(to_date, f'{year + 1}-01-01'))
+        if stop <= start:
+            continue
+        present = [sta for sta in df.columns[1:] if stations is None or sta in stations]
+        extremes = reduce.reduce(df[present].to_numpy()[start:stop], axis=0)
+        for sta, value in zip(present, extremes):
+            values[sta] = reduce(values.get(sta, np.nan), value)
+    return pd.Series(values, dtype=float)
+
+
+def recompute(name):
+    """
+    Outputs:
+        pandas.DataFrame: The whole summary computed from the hourly files, a row for the season
+                          that ends in every year but the first.
+    """
+    prefix, aggregation, _, column = SUMMARIES[name]
+    years = list(year_files(prefix))
+    cube = open_cube(prefix) if aggregation != 'sum' else None
+    rows = []
+    for year in years[1:]:
+        label = f'{year - 1}-{year}'
+        rows.append({column: label, **season_values(name, label, cube=cube).to_dict()})
+        msg = f'{name} {label}'
+        print(f'\r{msg:<80}', end='', flush=True)
+    print()
+    return pd.DataFrame(rows)
+
+
+def save(name, df):
+    path = summary_path(name)
+    df.to_csv(path, index=False)
+    round_data(path)
+
+
+def update_seasons(prefix, before, after, since):
+    """
+    Brings the summaries of a yearly file up to date with the hours just merged into it.
+
+    Inputs:
+        prefix (str): Yearly file prefix, e.g. 'rain'. Files without a summary are ignored.
+        before (pandas.DataFrame): The yearly file before the update, datetime first.
+        after (pandas.DataFrame): The yearly file as written, e.g. upsert(before, df_new, ...).
+        since (str): First hour of the update 'YYYY-MM-DD HH:MM', the rows before it are the
+                     same in both frames.
+
+    Outputs:
+        list: Summaries written.
+    """
+    names = [name for name, summary in SUMMARIES.items()
+             if summary[0] == prefix and os.path.exists(summary_path(name))]
+    if len(names) == 0:
+        return []
+    new = after.iloc[after['datetime'].searchsorted(since):].set_index('datetime')
+    old = before.iloc[before['datetime'].searchsorted(since):].set_index('datetime')
+    # hours and stations that are new to the file were NaN
+    old = old.reindex(index=new.index, columns=new.columns)
+    stations = list(new.columns)
+    for name in names:
+        _, aggregation, month, column = SUMMARIES[name]
+        df = pd.read_csv(summary_path(name))
+        labels = season_labels(new.index, month)
+        for label in np.unique(labels):
+            if label not in df[column].values:
+                years = list(year_files(prefix))
+                if int(label[-4:]) in years[1:]:
+                    # a new season, its earlier hours are in the previous file
+                    row = pd.DataFrame([{column: label, **season_values(name, label).to_dict()}])
+                    df = pd.concat([df, row], ignore_index=True).sort_values(column, kind='stable')
+                    df = df.reset_index(drop=True)
+                continue
+            rows = labels == label
+            n, o = new.to_numpy()[rows], old.to_numpy()[rows]
+            irow = np.flatnonzero(df[column].values == label)[0]
+            df = df.reindex(columns=list(df.columns) + [sta for sta in stations if sta not in df.columns])
+            current = df.loc[irow, stations].to_numpy(dtype=float)
+            if aggregation == 'sum':
+                value = np.round(np.nan_to_num(current) + np.nansum(n, axis=0) - np.nansum(o, axis=0), 1)
+            else:
+                reduce = np.fmin if aggregation == 'min' else np.fmax
+                value = reduce(current, reduce.reduce(n, axis=0))
+                # an extreme whose hour now holds another value may not be the extreme anymore
+                lost = ((o == current) & (n != o)).any(axis=0)
+                if lost.any():
+                    lost = [sta for sta, flag in zip(stations, lost) if flag]
+                    fixed = season_values(name, label, stations=lost)
+                    value[[stations.index(sta) for sta in lost]] = fixed.reindex(lost).to_numpy()
+            df.loc[irow, stations] = value
+        save(name, df)
+    return names
+
+
+def verify(name):
+    """
+    Outputs:
+        list: Seasons whose row differs from a full recompute, ['columns'] if the stations differ.
+    """
+    expected = recompute(name)
+    actual = pd.read_csv(summary_path(name))
+    column = SUMMARIES[name][3]
+    if list(actual.columns) != list(expected.columns):
+        return ['columns']
+    if not actual[column].equals(expected[column]):
+        return sorted(set(actual[column]) ^ set(expected[column]))
+    values = actual.iloc[:, 1:].to_numpy(dtype=float)
+    rounded = np.round(expected.iloc[:, 1:].to_numpy(dtype=float), 1)
+    same = (values == rounded) | (np.isnan(values) & np.isnan(rounded))
+    return expected[column][~same.all(axis=1)].tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute or verify the seasonal summaries.')
+    parser.add_argument('names', nargs='*', default=list(SUMMARIES), help=f"summaries, default {', '.join(SUMMARIES)}")
+    parser.add_argument('--verify', action='store_true', help='compare the files with a full recompute')
+    args = parser.parse_args()
+    failed = False
+    for name in args.names:
+        if args.verify:
+            differ = verify(name)
+            print(f'{name}: ' + (f'differs in {", ".join(differ)}' if differ else 'same as a full recompute'))
+            failed = failed or len(differ) > 0
+        else:
+            save(name, recompute(name))
+            print(f'saved {summary_path(name)}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
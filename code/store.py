@@ -0,0 +1,558 @@
+"""
+store.py
+
+Binary mirror of the yearly hourly CSVs (rain_, temp_min_, temp_max_, grad_, rh_, ws_, wd_).
+
+The CSVs stay the published format. For each one a mirror in cache/store next to it (i.e.
+data/cache/store, or IMS_STORE_DIR) holds the same table in numpy's compressed npz format: the
+datetime column as datetime64[m], the station names and the values as one float32 matrix
+(hours x stations). Parsing ~200 MB of text and converting the datetime strings is then
+replaced by inflating ~50 MB into arrays.
+
+float32 keeps ~7 significant digits, and the CSVs are rounded to a fixed number of decimals
+(round_data), so the mirror also stores that number and rounding the float32 values back to it
+gives exactly the float64 numbers pd.read_csv returns. Files whose values don't round-trip
+this way are mirrored as float64.
+
+Rain is mostly NaN (an hour is written only when it rained), so the rain mirrors are sparse: each
+station's rainy hours as row numbers and values, one run after the other (indptr marks where each
+station's run starts). read_rain densifies only the stations and hours asked for, and rain_totals
+sums them without densifying at all, so both cost in proportion to the rainy hours.
+
+A mirror carries the mtime and size of the CSV it was made from. read_year uses it only while
+they match, otherwise it reads the CSV and rewrites the mirror, so a CSV changed by any script
+never serves stale data. The update scripts write through write_year, which rewrites only the
+CSV lines from the first one that changed (an update touches the last days of the year) and
+the mirror with them, or nothing at all if no line changed.
+
+A long-running process (daemon.py) can also keep the current year's frames in memory
+(keep_resident): read_year then returns the frame it last read or wrote for a file, checked
+against the same mtime and size, without loading the mirror again.
+
+Usage:
+    from store import read_year
+    df = read_year('data/temp_max_2024.csv')                     # same as pd.read_csv
+    df = read_year('data/temp_max_2024.csv', parse_dates=True)   # datetime as pd.to_datetime
+    df = read_rain(['BET DAGAN', 'ARAD'], '2023-09-01', '2024-09-01')   # hourly rain over years
+    totals = rain_totals('2023-09-01', '2024-09-01')                  # per station, NaN as 0
+
+    write_year('data/rain_2026.csv', df_rain)                      # to_csv + round_data, in place
+
+    python code/store.py            # (re)build the mirrors of all yearly files in data/
+    python code/store.py --verify   # check every mirror against its CSV
+    python code/store.py --check    # check write_year against to_csv + round_data
+"""
+import os
+import io
+import re
+import sys
+import glob
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from cache import _write_atomic
+from weather_data import round_text, round_data
+
+YEARLY = re.compile(r'^(rain|temp_min|temp_max|grad|rh|ws|wd)_\d{4}\.csv$')
+SPARSE = re.compile(r'^rain_\d{4}\.csv$')
+# files of 1-decimal values, whose new lines write_year rounds
+ROUNDED = re.compile(r'^(rain|temp_min|temp_max)_\d{4}\.csv$')
+
+
+def mirror_path(csv_path):
+    """
+    Outputs:
+        str or None: Path of the mirror of a yearly CSV, None if the file isn't a yearly file.
+    """
+    name = os.path.basename(csv_path)
+    if not YEARLY.match(name):
+        return None
+    root = os.environ.get('IMS_STORE_DIR') or os.path.join(os.path.dirname(csv_path), 'cache', 'store')
+    return os.path.join(root, name[:-4] + '.npz')
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+
+def _decimals(values):
+    # fewest decimals that give back the exact float64 values from float32, None if none does
+    back = values.astype(np.float32).astype(np.float64)
+    for decimals in range(5):
+        if np.array_equal(np.round(back, decimals), values, equal_nan=True):
+            return decimals
+    return None
+
+
+# current-year frames in memory, path -> (stamp, frame), see keep_resident
+_resident = {}
+_keep = []
+
+
+def keep_resident(enable=True):
+    """
+    Keeps the frames of the current year's files in memory from now on, for a process that reads
+    them again and again. A frame is served while its CSV has the mtime and size it was read or
+    written with, so a CSV changed by another process is read again.
+
+    Inputs:
+        enable (bool): False drops the frames kept so far. Default is True.
+    """
+    _keep[:] = [True] if enable else []
+    if not enable:
+        _resident.clear()
+
+
+def resident_files():
+    """
+    Outputs:
+        dict: Yearly CSV -> size in bytes of its frame kept in memory.
+    """
+    return {path: int(df.memory_usage(deep=False).sum()) for path, (_, df) in _resident.items()}
+
+
+def _remember(csv_path, stamp, df):
+    # keeps a copy of the frame of a current-year file, as the CSV with that stamp reads
+    year = datetime.now().year
+    for path in [path for path in _resident if int(path[-8:-4]) < year]:
+        del _resident[path]  # the year has turned
+    if _keep and int(csv_path[-8:-4]) >= year:
+        _resident[os.path.abspath(csv_path)] = (stamp, df.copy())
+
+
+def _recall(csv_path, stamp):
+    kept = _resident.get(os.path.abspath(csv_path))
+    if kept is None or not np.array_equal(kept[0], stamp):
+        return None
+    return kept[1].copy()
+
+
+def write_mirror(csv_path, df=None, stamp=None):
+    """
+    Writes the mirror of a yearly CSV.
+
+    Inputs:
+        csv_path (str): Yearly CSV.
+        df (pandas.DataFrame): The CSV as read by pd.read_csv, to save reading it again.
+        stamp (numpy.ndarray): mtime and size of the CSV when df was read. Required with df.
+
+    Outputs:
+        bool: True if the mirror was written, False if the file can't be mirrored.
+    """
+    path = mirror_path(csv_path)
+    if path is None:
+        return False
+    if df is None:
+        stamp = _stamp(csv_path)
+        df = pd.read_csv(csv_path)
+    if len(df.columns) == 0 or df.columns[0] != 'datetime':
+        return False
+    stations = list(df.columns[1:])
+    if any(df[name].dtype != np.float64 for name in stations):
+        return False
+    text = df['datetime'].to_numpy(dtype=str)
+    try:
+        stamps = np.array(np.char.replace(text, ' ', 'T'), dtype='datetime64[m]')
+    except ValueError:
+        return False
+    if not np.array_equal(_datetime_strings(stamps), text):
+        return False
+    values = df[stations].to_numpy(dtype=np.float64)
+    arrays = {'datetime': stamps, 'stations': np.array(stations, dtype=str), 'stamp': stamp}
+    if SPARSE.match(os.path.basename(csv_path)):
+        arrays['indptr'], arrays['rows'], values = _to_sparse(values)
+    decimals = _decimals(values)
+    arrays['values'] = values.astype(np.float32) if decimals is not None else values
+    arrays['decimals'] = np.int64(-1 if decimals is None else decimals)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp, path)
+    _remember(csv_path, stamp, df)
+    return True
+
+
+def _to_sparse(values):
+    # station by station (column-major), the rows and values of the non-NaN cells
+    present = ~np.isnan(values.T)
+    indptr = np.concatenate([[0], np.cumsum(present.sum(axis=1))]).astype(np.int64)
+    rows = np.nonzero(present)[1].astype(np.int32)
+    return indptr, rows, values.T[present]
+
+
+_parsed_dtype = []
+
+
+def _datetime_dtype():
+    # resolution pd.to_datetime gives the CSV's strings, 'ns' in pandas 2 and 'us' in pandas 3
+    if not _parsed_dtype:
+        _parsed_dtype.append(pd.to_datetime(pd.Series(['2000-01-01 00:00'])).dtype)
+    return _parsed_dtype[0]
+
+
+def _datetime_strings(stamps):
+    return np.char.replace(np.datetime_as_string(stamps, unit='m'), 'T', ' ')
+
+
+def _load(path, stamp):
+    # the mirror's arrays, values back as the CSV's float64, None if stale or unreadable
+    try:
+        with np.load(path) as npz:
+            if not np.array_equal(npz['stamp'], stamp):
+                return None
+            arrays = {key: npz[key] for key in npz.files if key != 'stamp'}
+    except (OSError, ValueError, KeyError):
+        return None
+    values = arrays['values'].astype(np.float64)
+    if arrays['decimals'] >= 0:
+        np.round(values, int(arrays['decimals']), out=values)
+    arrays['values'] = values
+    return arrays
+
+
+def _dense(arrays, columns=None, rows=None):
+    # hours x stations matrix of the given station indices and row range (default all)
+    start, stop = rows or (0, len(arrays['datetime']))
+    if 'indptr' not in arrays:
+        values = arrays['values'][start:stop]
+        return values if columns is None else values[:, columns]
+    indptr = arrays['indptr']
+    columns = np.arange(len(indptr) - 1) if columns is None else np.asarray(columns, dtype=int)
+    dense = np.full((stop - start, len(columns)), np.nan)
+    for col, station in enumerate(columns):
+        lo, hi = indptr[station], indptr[station + 1]
+        hours = arrays['rows'][lo:hi]
+        keep = slice(lo + np.searchsorted(hours, start), lo + np.searchsorted(hours, stop))
+        dense[arrays['rows'][keep] - start, col] = arrays['values'][keep]
+    return dense
+
+
+def _frame(stamps, stations, values, parse_dates):
+    df = pd.DataFrame(values, columns=pd.Index(stations, dtype=object), copy=False)
+    if parse_dates:
+        df.insert(0, 'datetime', stamps.astype(_datetime_dtype()))
+    else:
+        df.insert(0, 'datetime', _datetime_strings(stamps).astype(object))
+    return df
+
+
+def _read_mirror(path, stamp, parse_dates):
+    arrays = _load(path, stamp)
+    if arrays is None:
+        return None
+    return _frame(arrays['datetime'], arrays['stations'].tolist(), _dense(arrays), parse_dates)
+
+
+def read_year(csv_path, parse_dates=False):
+    """
+    Reads a yearly CSV through its binary mirror.
+
+    Inputs:
+        csv_path (str): Yearly CSV, e.g. 'data/rain_2024.csv'. Other CSVs are read as they are.
+        parse_dates (bool): If True, the datetime column is converted like pd.to_datetime does.
+                            Default is False (strings, as in the CSV).
+
+    Outputs:
+        pandas.DataFrame: Same as pd.read_csv(csv_path) (and pd.to_datetime on the datetime column).
+    """
+    path = mirror_path(csv_path)
+    if path is not None and _keep:
+        stamp = _stamp(csv_path)
+        df = _recall(csv_path, stamp)
+        if df is None and os.path.exists(path):
+            df = _read_mirror(path, stamp, False)
+            if df is not None:
+                _remember(csv_path, stamp, df)
+        if df is not None:
+            if parse_dates:
+                df['datetime'] = pd.to_datetime(df['datetime'])
+            return df
+    if path is not None and os.path.exists(path):
+        df = _read_mirror(path, _stamp(csv_path), parse_dates)
+        if df is not None:
+            return df
+    stamp = _stamp(csv_path)
+    df = pd.read_csv(csv_path)
+    if path is not None:
+        try:
+            write_mirror(csv_path, df, stamp)
+        except OSError:
+            pass  # read-only checkout, keep reading the CSV
+    if parse_dates:
+        df['datetime'] = pd.to_datetime(df['datetime'])
+    return df
+
+
+def sync(csv_path):
+    """
+    Rewrites the mirror of a yearly CSV if it's missing, older than the CSV or in the wrong layout.
+
+    Outputs:
+        bool: True if the mirror was written.
+    """
+    path = mirror_path(csv_path)
+    if path is None or not os.path.exists(csv_path):
+        return False
+    if os.path.exists(path):
+        try:
+            with np.load(path) as npz:
+                sparse = SPARSE.match(os.path.basename(csv_path)) is not None
+                if np.array_equal(npz['stamp'], _stamp(csv_path)) and ('indptr' in npz.files) == sparse:
+                    return False
+        except (OSError, ValueError, KeyError):
+            pass
+    return write_mirror(csv_path)
+
+
+def _first_change(old, df):
+    # first row whose datetime or values differ, len of the shorter frame if none does
+    rows = min(len(old), len(df))
+    changed = old['datetime'].to_numpy()[:rows] != df['datetime'].to_numpy()[:rows]
+    a = old.iloc[:rows, 1:].to_numpy(dtype=np.float64)
+    b = df.iloc[:rows, 1:].to_numpy(dtype=np.float64)
+    changed |= ((a != b) & ~(np.isnan(a) & np.isnan(b))).any(axis=1)
+    first = np.flatnonzero(changed)
+    return int(first[0]) if len(first) else rows
+
+
+def _tail(f, count):
+    # byte offset and lines of the last count lines of a binary file
+    end = f.seek(0, os.SEEK_END)
+    if count <= 0:
+        return end, []
+    start, data = end, b''
+    while start > 0 and data.count(b'\n') <= count:
+        step = min(start, 1 << 16)
+        start -= step
+        f.seek(start)
+        data = f.read(step) + data
+    lines = data.splitlines(keepends=True)[-count:]
+    return end - sum(len(line) for line in lines), lines
+
+
+def write_year(csv_path, df):
+    """
+    Writes an updated CSV as df.to_csv(index=False) and round_data would, rewriting only the
+    lines from the first one that changed.
+
+    The rows from the first one whose values differ from the file are formatted and compared
+    with the file's lines: the file is cut at the first line that differs and the new lines
+    are written from there. If no line differs the file isn't touched, so its mtime (and the
+    mirror and cube built on it) stay valid. A new column changes every line, the file is then
+    written whole and rounded by round_data.
+
+    round_data keeps a file unrounded when rounding changes its column sums, as it does for the
+    2-decimal means of monitor_update, so new lines are rounded only in the rain and temperature
+    files (ROUNDED). The values already in a file can't tell: a new monitor file may hold only
+    NaN, or only 1-decimal means, and its later 2-decimal lines must stay as they are.
+
+    Inputs:
+        csv_path (str): CSV to write, usually a yearly file.
+        df (pandas.DataFrame): Its new content, datetime first.
+
+    Outputs:
+        int: Number of lines written, 0 if the file didn't change.
+    """
+    header = df.iloc[:0].to_csv(index=False)
+    current = None
+    if os.path.exists(csv_path):
+        with open(csv_path, 'rb') as f:
+            current = f.readline().decode('utf8')
+    if current != header:
+        _write_atomic(csv_path, df.to_csv(index=False).encode('utf8'))
+        round_data(csv_path)
+        sync(csv_path)
+        return len(df) + 1
+    old = read_year(csv_path)
+    start = _first_change(old, df)
+    text = df.iloc[start:].to_csv(index=False, header=False)
+    if ROUNDED.match(os.path.basename(csv_path)):
+        text = round_text(text)
+    lines = text.encode('utf8').splitlines(keepends=True)
+    with open(csv_path, 'r+b') as f:
+        offset, old_lines = _tail(f, len(old) - start)
+        same = 0
+        while same < min(len(lines), len(old_lines)) and lines[same] == old_lines[same]:
+            same += 1
+        if same == len(lines) == len(old_lines):
+            return 0
+        f.seek(offset + sum(len(line) for line in old_lines[:same]))
+        f.writelines(lines[same:])
+        f.truncate()
+    if mirror_path(csv_path) is not None:
+        # the file's content is the unchanged rows plus the new lines, no need to read it again
+        stamp = _stamp(csv_path)
+        tail = pd.read_csv(io.StringIO(header + b''.join(lines).decode('utf8')))
+        content = pd.concat([old.iloc[:start], tail], ignore_index=True) if start else tail
+        try:
+            write_mirror(csv_path, content, stamp)
+        except OSError:
+            pass
+    return len(lines) - same
+
+
+def _rain_year(csv_path):
+    # sparse arrays of a rain file, from the mirror (brought up to date first) or the CSV
+    path = mirror_path(csv_path)
+    sync(csv_path)
+    arrays = _load(path, _stamp(csv_path)) if os.path.exists(path) else None
+    if arrays is None:
+        df = pd.read_csv(csv_path)
+        stamps = pd.to_datetime(df['datetime']).to_numpy().astype('datetime64[m]')
+        indptr, rows, values = _to_sparse(df[df.columns[1:]].to_numpy(dtype=np.float64))
+        arrays = {'datetime': stamps, 'stations': np.array(df.columns[1:], dtype=str),
+                  'indptr': indptr, 'rows': rows, 'values': values}
+    return arrays
+
+
+def _rain_years(from_date, to_date, data_dir):
+    # (arrays, first row, stop row) of every rain file overlapping from_date <= datetime < to_date
+    start, stop = np.datetime64(from_date, 'm'), np.datetime64(to_date, 'm')
+    first, last = int(str(start)[:4]), int(str(stop - 1)[:4])
+    for year in range(first, last + 1):
+        csv_path = os.path.join(data_dir, f'rain_{year}.csv')
+        if not os.path.exists(csv_path):
+            continue
+        arrays = _rain_year(csv_path)
+        stamps = arrays['datetime']
+        rows = (int(np.searchsorted(stamps, start)), int(np.searchsorted(stamps, stop)))
+        if rows[1] > rows[0]:
+            yield arrays, rows
+
+
+def read_rain(stations=None, from_date=None, to_date=None, parse_dates=False, data_dir='data'):
+    """
+    Hourly rain of some stations over a window, densified from the sparse mirrors.
+
+    Inputs:
+        stations (list): Station names. Default is all stations with a column in the window.
+        from_date (str): Start, 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM', inclusive. Default is 1989-01-01.
+        to_date (str): End, exclusive. Default is the start of next year.
+        parse_dates (bool): If True, the datetime column is converted like pd.to_datetime does.
+        data_dir (str): Directory of the rain files. Default is data.
+
+    Outputs:
+        pandas.DataFrame: datetime and one column per station, as the rain files' rows in the
+                          window. Stations without a column in a year are NaN in that year.
+    """
+    from_date = from_date or '1989-01-01'
+    to_date = to_date or f'{pd.Timestamp.now().year + 1}-01-01'
+    parts = []
+    names = list(stations) if stations is not None else []
+    for arrays, rows in _rain_years(from_date, to_date, data_dir):
+        index = {name: col for col, name in enumerate(arrays['stations'].tolist())}
+        if stations is None:
+            names += [name for name in index if name not in names]
+        parts.append((arrays, rows, index))
+    stamps = [arrays['datetime'][rows[0]:rows[1]] for arrays, rows, _ in parts]
+    values = np.full((sum(len(s) for s in stamps), len(names)), np.nan)
+    offset = 0
+    for (arrays, rows, index), part in zip(parts, stamps):
+        pairs = [(col, index[name]) for col, name in enumerate(names) if name in index]
+        if pairs:
+            cols, columns = zip(*pairs)
+            values[offset:offset + len(part), list(cols)] = _dense(arrays, columns, rows)
+        offset += len(part)
+    stamps = np.concatenate(stamps) if stamps else np.array([], dtype='datetime64[m]')
+    return _frame(stamps, names, values, parse_dates)
+
+
+def rain_totals(from_date, to_date, data_dir='data'):
+    """
+    Rain sum per station over a window, e.g. a Sep-Aug winter, from the rainy hours only.
+
+    Inputs:
+        from_date (str): Start, 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM', inclusive.
+        to_date (str): End, exclusive.
+        data_dir (str): Directory of the rain files. Default is data.
+
+    Outputs:
+        pandas.Series: Total per station (np.nansum, so 0 for no rain), for every station with a
+                       column in the window's files, in the order they first appear.
+    """
+    totals = {}
+    for arrays, (start, stop) in _rain_years(from_date, to_date, data_dir):
+        indptr, rows = arrays['indptr'], arrays['rows']
+        station = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        keep = (rows >= start) & (rows < stop)
+        sums = np.bincount(station[keep], weights=arrays['values'][keep], minlength=len(indptr) - 1)
+        for name, total in zip(arrays['stations'].tolist(), sums):
+            totals[name] = totals.get(name, 0.0) + total
+    return pd.Series(totals, dtype=float)
+
+
+def yearly_files(data_dir='data'):
+    """
+    Outputs:
+        list: All yearly CSVs in data_dir.
+    """
+    return sorted(f for f in glob.glob(os.path.join(data_dir, '*.csv')) if YEARLY.match(os.path.basename(f)))
+
+
+def check_write():
+    """
+    Updates small yearly files with write_year and compares each with the same content written
+    whole by to_csv and round_data, as the update scripts did before write_year.
+
+    Outputs:
+        list: Names of the cases whose file differs, empty if all match.
+    """
+    hours = [f'2027-01-01 {hour:02d}:00' for hour in range(6)]
+    nan = [np.nan] * 6
+    cases = {
+        # a monitor file created before any data was published, then 2-decimal hourly means
+        'rh_2027.csv': ({'A': nan, 'B': nan}, {'A': nan[:3] + [85.33, 84.17, 61.25], 'B': nan}),
+        # a monitor file whose means happened to have 1 decimal so far
+        'ws_2027.csv': ({'A': [1.5, 2.0] + nan[:4]}, {'A': [1.5, 2.0, 2.34, 1.24] + nan[:2]}),
+        # rain sums with float noise
+        'rain_2027.csv': ({'A': [0.1] + nan[:5]}, {'A': [0.1, 0.1 + 0.2, 0.7] + nan[:3]}),
+        'temp_max_2027.csv': ({'A': [12.5, 12.9] + nan[:4]}, {'A': [12.5, 12.9, 13.26, 13.04] + nan[:2]}),
+    }
+    failed = []
+    tmp = tempfile.mkdtemp()
+    try:
+        for name, (before, after) in cases.items():
+            path, expected = os.path.join(tmp, name), os.path.join(tmp, 'expected.csv')
+            pd.DataFrame({'datetime': hours, **before}).to_csv(path, index=False)
+            read_year(path)
+            df = pd.DataFrame({'datetime': hours, **after})
+            write_year(path, df)
+            df.to_csv(expected, index=False)
+            round_data(expected)
+            with open(path, 'rb') as f, open(expected, 'rb') as g:
+                if f.read() != g.read() or not read_year(path).equals(pd.read_csv(expected)):
+                    failed.append(name)
+    finally:
+        shutil.rmtree(tmp)
+    return failed
+
+
+def main():
+    if '--check' in sys.argv:
+        failed = check_write()
+        print(f'write_year differs from to_csv + round_data: {failed}' if failed else 'write_year ok')
+        sys.exit(1 if failed else 0)
+    verify = '--verify' in sys.argv
+    files = yearly_files()
+    failed = []
+    for count, file in enumerate(files):
+        if verify:
+            expected = pd.read_csv(file)
+            if not read_year(file).equals(expected) or not read_year(file).equals(expected):
+                failed.append(file)
+        else:
+            sync(file)
+        msg = f'{"verified" if verify else "synced"} {file} ({count + 1}/{len(files)})'
+        print(f'\r{msg:<80}', end='', flush=True)
+    print()
+    if failed:
+        print(f'mirrors differ from the CSV: {failed}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
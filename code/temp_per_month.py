@@ -9,39 +9,11 @@ from datetime import datetime, timedelta
 # Setup paths
 home = os.environ['HOME']
 sys.path.append(f'{home}/weather/code')
-from weather import round_data
+from store import read_year
+from regions import region_index, region_codes, regional_medians, stack
 
-# Load station data for region mapping
-df_stations = pd.read_csv('data/ims_stations.csv')
-
-# Regional mapping (matching rain_per_month.py)
-regions = {
-    'יהודה ושומרון': 7,
-    'גליל וגולן': 8,
-    'עמקי הצפון': 9,
-    'ים המלח והערבה': 10,
-    'כרמל וחיפה': 11,
-    'נגב': 12,
-    'גוש דן והשרון': 13,
-    'מישור חוף דרומי': 14,
-    'מישור חוף צפוני': 15,
-}
-
-# Fix regional overrides based on station name
-fix = {
-    'EDEN FARM 20080706': 'עמקי הצפון',
-    'HAIFA PORT': 'מישור חוף צפוני',
-    'ROSH HANIQRA_1m': 'מישור חוף צפוני',
-    'AFEQ_1m': 'מישור חוף צפוני',
-    'GILGAL_1m': 'ים המלח והערבה',
-    'ASHDOD PORT_1m': 'מישור חוף דרומי'
-}
-
-# Apply fixes to df_stations
-for station_name, region_name in fix.items():
-    idx = df_stations[df_stations['name'] == station_name].index
-    if not idx.empty:
-        df_stations.at[idx[0], 'regionId'] = regions[region_name]
+# Region of every station (see regions.py)
+index = region_index()
 
 def get_cycle_and_month(date, monitor_type):
     """Determine the cycle name and month for a given date and monitor type."""
@@ -60,45 +32,49 @@ def get_cycle_and_month(date, monitor_type):
         else:
             return f"{y-1}-{y}", m
 
-def compute_monthly_medians(df, monitor_type):
-    """Compute regional medians from a dataframe of hourly data."""
-    if df.empty:
-        return []
-    
-    df['datetime'] = pd.to_datetime(df['datetime'])
-    df['Month'] = df['datetime'].dt.month
-    
-    if monitor_type == 'min':
-        df['Cycle'] = df.apply(lambda row: f"{row['datetime'].year-1}-{row['datetime'].year}" if row['datetime'].month < 9 else f"{row['datetime'].year}-{row['datetime'].year+1}", axis=1)
-    else:
-        df['Cycle'] = df.apply(lambda row: f"{row['datetime'].year-1}-{row['datetime'].year}" if row['datetime'].month < 3 else f"{row['datetime'].year}-{row['datetime'].year+1}", axis=1)
+def monthly_extremes(df, monitor_type):
+    """
+    Lowest (min) or highest (max) value of every station in every month of hourly data.
 
+    Outputs:
+        (list, list, numpy.ndarray): (cycle, month) of every month, the stations and their
+                                     values (months x stations).
+    """
+    dt = pd.to_datetime(df['datetime'])
+    months = dt.dt.month.to_numpy()
+    # first year of the cycle: Sept-Aug for min, Mar-Feb for max
+    first = dt.dt.year.to_numpy() - (months < (9 if monitor_type == 'min' else 3))
+    keys = first * 100 + months
+    order = np.argsort(keys, kind='stable')
+    found, start = np.unique(keys[order], return_index=True)
     stations = [col for col in df.columns if col not in ['datetime', 'Month', 'Cycle']]
-    results = []
-    
-    for (cycle, month), group in df.groupby(['Cycle', 'Month']):
-        if monitor_type == 'min':
-            station_values = group[stations].min()
-        else:
-            station_values = group[stations].max()
-        
-        if station_values.isna().all():
-            continue
+    reduce = np.fmin if monitor_type == 'min' else np.fmax
+    values = reduce.reduceat(df[stations].to_numpy(dtype=float)[order], start, axis=0)
+    return [(f"{key // 100}-{key // 100 + 1}", int(key % 100)) for key in found], stations, values
 
-        for region_name, rid in regions.items():
-            region_stations = df_stations[df_stations['regionId'] == rid]['name'].tolist()
-            available_stations = [s for s in region_stations if s in stations]
-            
-            if available_stations:
-                region_vals = station_values[available_stations].dropna()
-                if not region_vals.empty:
-                    median_val = region_vals.median()
-                    results.append({
-                        'Region': region_name,
-                        'Cycle': cycle,
-                        'Month': month,
-                        'Temp': round(float(median_val), 1)
-                    })
+
+def compute_monthly_medians(parts):
+    """
+    Regional medians of the monthly extremes of one or more frames, all computed at once.
+
+    Inputs:
+        parts (list): monthly_extremes of every frame.
+
+    Outputs:
+        list: Dicts of Region, Cycle, Month and Temp, for every month and every region with a value.
+    """
+    rows, stations, values, _ = stack(parts)
+    medians = regional_medians(values, region_codes(stations, index))
+    results = []
+    for row, (cycle, month) in enumerate(rows):
+        for region_name, (median, found) in medians.items():
+            if found[row]:
+                results.append({
+                    'Region': region_name,
+                    'Cycle': cycle,
+                    'Month': month,
+                    'Temp': round(float(median[row]), 1)
+                })
     return results
 
 def process_temp_data(monitor_type, force=False):
@@ -115,11 +91,8 @@ def process_temp_data(monitor_type, force=False):
     if force or not os.path.exists(output_file):
         print(f"Full recompute for {prefix}...")
         files = sorted(glob(f'data/{prefix}_*.csv'))
-        all_results = []
-        for file in files:
-            df = pd.read_csv(file)
-            all_results.extend(compute_monthly_medians(df, monitor_type))
-        df_final = pd.DataFrame(all_results)
+        parts = [monthly_extremes(read_year(file, parse_dates=True), monitor_type) for file in files]
+        df_final = pd.DataFrame(compute_monthly_medians(parts))
     else:
         print(f"Incremental update for {prefix}...")
         df_final = pd.read_csv(output_file)
@@ -139,11 +112,10 @@ def process_temp_data(monitor_type, force=False):
             year = target_date.year
             file = f'data/{prefix}_{year}.csv'
             if os.path.exists(file):
-                df_year = pd.read_csv(file)
-                df_year['datetime'] = pd.to_datetime(df_year['datetime'])
+                df_year = read_year(file, parse_dates=True)
                 df_month = df_year[df_year['datetime'].dt.month == month]
                 
-                new_data = compute_monthly_medians(df_month, monitor_type)
+                new_data = compute_monthly_medians([monthly_extremes(df_month, monitor_type)]) if len(df_month) else []
                 if new_data:
                     # Remove old entries for this cycle/month
                     df_final = df_final[~((df_final['Cycle'] == cycle) & (df_final['Month'] == month))]
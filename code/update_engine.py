@@ -0,0 +1,334 @@
+"""
+update_engine.py
+
+Incremental update of the yearly hourly CSVs (data/{prefix}_{year}.csv) of every monitor, the
+engine behind rain_update.py, temp_update.py and monitor_update.py.
+
+A monitor is configuration: its records are binned into hours by its aggregation (MONITORS),
+its yearly file prefix and query come from the tables weather.py and backfill.py already keep.
+An update first plans the gap of every active station of every monitor it was given, then runs
+all the gap queries as one batch on the fetch engine's worker pool (fetch.py), and finally
+merges each file's new hours (upsert), writes the lines that changed (store.write_year) and
+brings the seasonal summaries up to date with the new hours (seasons.py).
+
+A new yearly file gets a column for every station of the registry with the monitor whose
+activity window overlaps the year (year_stations), as the collectors' full-year runs do. An
+existing file is updated for the stations last seen in data/ims_activity.csv (active_stations).
+A gap starts at the station's watermark (watermarks.py), so planning costs one lookup per
+station. The file is scanned for the last valid hour of a column, in one vectorized pass, only
+for the stations that have no watermark yet, and for a past year, which the watermarks don't
+cover. The watermarks are saved once every file is written. plan_update is the planning step
+alone, the planner (planner.py) costs its calls before a run.
+
+Usage (from the repository root):
+    python code/update_engine.py Rain                  # the current year
+    python code/update_engine.py TDmin TDmax
+    python code/update_engine.py RH WS --year 2025     # a past year, up to its last day
+    python code/update_engine.py Rain TDmin --check    # a new file keeps last year's columns
+"""
+import os
+import sys
+import time
+import argparse
+import functools
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from fetch import FetchEngine
+from registry import station_registry
+from watermarks import Watermarks
+from store import read_year, write_year
+from seasons import update_seasons
+from weather import (get_client, note_activity, hour_vector, add_rain_column, add_temp_column,
+                     add_mean_column, upsert, file_prefix, query_unit)
+
+# aggregation of the records of every monitor within an hour
+MONITORS = {'Rain': 'sum', 'TDmin': 'min', 'TDmax': 'max',
+            'Grad': 'mean', 'RH': 'mean', 'WS': 'mean', 'WD': 'mean'}
+# binning of every aggregation, as the collectors (rain_1h, temp_1h, monitor_1h) bin a year
+AGGREGATIONS = {'sum': add_rain_column,
+                'min': functools.partial(add_temp_column, monitor='TDmin'),
+                'max': functools.partial(add_temp_column, monitor='TDmax'),
+                'mean': add_mean_column}
+# channel of the 1-minute stations ('_1m' in their name, since 2017), which have no other monitor
+MINUTE_CHANNELS = {'Rain': 'Rain_1_min'}
+
+
+def active_stations(path='data/ims_activity.csv'):
+    """
+    Outputs:
+        list: Names of the stations last seen on the most recent activity date, in file order.
+    """
+    df_act = pd.read_csv(path)
+    latest = df_act['latest'].max()[:10]
+    return df_act[df_act['latest'] >= latest]['name'].tolist()
+
+
+def year_stations(year, to_date, path='data/ims_activity.csv'):
+    """
+    Stations a new yearly file is collected for, as rain_1h, temp_1h and monitor_1h pick them
+    with stations=None: every station of the registry, without those whose activity window
+    ends before the year or starts after to_date (before 2026 only).
+
+    Outputs:
+        list: Station names, in registry order.
+    """
+    stations = list(station_registry().ids)
+    if year >= 2026:  # don't skip stations active in 2026, as the collectors
+        return stations
+    df_act = pd.read_csv(path)
+    earliest = dict(zip(df_act['name'], df_act['earliest'].fillna('')))
+    latest = dict(zip(df_act['name'], df_act['latest'].fillna('')))
+    return [sta for sta in stations
+            if sta in latest and not (f'{year}-01-01' > latest[sta] or to_date < earliest[sta])]
+
+
+def hours_until_now(from_date, to_date):
+    """
+    Outputs:
+        list: Hourly axis from from_date to to_date, up to now (as in the collectors).
+    """
+    hours = hour_vector(from_date, to_date)
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M")
+    if hours[-1] > now_str:
+        hours = [h for h in hours if h <= now_str]
+    return hours
+
+
+def last_valid_days(df, stations):
+    """
+    Day of the last value of station columns, in one vectorized pass over the frame.
+
+    Outputs:
+        dict: Station -> 'YYYY-MM-DD', for the stations with a column that has values.
+    """
+    stations = [sta for sta in stations if sta in df.columns]
+    if len(stations) == 0 or len(df) == 0:
+        return {}
+    valid = df[stations].notna().to_numpy()
+    last = len(df) - 1 - np.argmax(valid[::-1], axis=0)
+    days = df['datetime'].to_numpy()[last]
+    return {sta: day[:10] for sta, day, found in zip(stations, days, valid.any(axis=0)) if found}
+
+
+def plan(monitor, year, df, stations, to_date, marks=None):
+    """
+    Gaps of one yearly file.
+
+    Inputs:
+        monitor (str): Monitor name, a key of MONITORS.
+        year (int): Year of the file.
+        df (pandas.DataFrame): The yearly file as it is, datetime first.
+        stations (list): Active station names, see active_stations.
+        to_date (str): Last day to query 'YYYY-MM-DD'.
+        marks (Watermarks): Watermarks the gaps start at. Default is None: every gap starts on
+                            the day of the column's last value (January 1 without one).
+
+    Outputs:
+        (list, list): Stations with the monitor, which the file gets a column for, and the gaps
+                      to query as (station, channel, from_date).
+    """
+    reg = station_registry()
+    first = f'{year}-01-01'
+    channels = {}
+    for station in stations:
+        channel = monitor
+        if '_1m' in station:
+            if monitor not in MINUTE_CHANNELS or year < 2017:
+                continue
+            channel = MINUTE_CHANNELS[monitor]
+        if reg.has(station, channel):
+            channels[station] = channel
+    unmarked = [sta for sta in channels if marks is None or marks.get(sta, monitor) is None]
+    last = last_valid_days(df, unmarked)
+    gaps = []
+    for station, channel in channels.items():
+        from_date = last.get(station, first)
+        if marks is not None:
+            # the gap starts where the last successful query ended, not at the last value
+            from_date = marks.start(station, monitor, default=from_date)
+        from_date = max(from_date, first)
+        if from_date <= to_date:
+            gaps.append((station, channel, from_date))
+    return list(channels), gaps
+
+
+def plan_new_file(monitor, year, to_date):
+    """
+    Plans a yearly file that doesn't exist yet: every station of year_stations with the monitor
+    is queried from January 1.
+
+    Outputs:
+        (pandas.DataFrame, list, list): The file's empty hourly frame, its stations and its gaps,
+                                        as in plan.
+    """
+    df = pd.DataFrame({'datetime': hours_until_now(f'{year}-01-01', to_date)})
+    columns, gaps = plan(monitor, year, df, year_stations(year, to_date), to_date)
+    return df, columns, gaps
+
+
+def plan_update(monitors, year=None, marks=None):
+    """
+    Plans an update of the yearly files of monitors, without querying anything: the calls it
+    makes are exactly these (see planner.py for their cost).
+
+    Inputs:
+        monitors (list): Monitor names, keys of MONITORS.
+        year (int or str): Year of the files. Default is the current year.
+        marks (Watermarks): Watermarks of the current year. Default is the saved ones.
+
+    Outputs:
+        (dict, list, str): Monitor -> (yearly CSV, its frame as it is, the stations it gets a
+                           column for, a frame of the hours to update), the calls to make as
+                           keyword arguments of query_unit (and 'monitor'), and the last day queried.
+    """
+    now = datetime.now()
+    year = int(year or now.year)
+    current = year == now.year
+    to_date = min(now.strftime('%Y-%m-%d'), f'{year}-12-31')
+    marks = marks or Watermarks()
+    stations = active_stations()
+    files = {}
+    calls = []
+    for monitor in monitors:
+        opcsv = f'data/{file_prefix(monitor)}_{year}.csv'
+        if not os.path.exists(opcsv):
+            df, columns, gaps = plan_new_file(monitor, year, to_date)
+        else:
+            df = read_year(opcsv)
+            columns, gaps = plan(monitor, year, df, stations, to_date, marks=marks if current else None)
+        hours = hours_until_now(min(gap[2] for gap in gaps), to_date) if gaps else []
+        files[monitor] = (opcsv, df, columns, pd.DataFrame({'datetime': hours}))
+        calls += [{'monitor': monitor, 'station': station, 'channel': channel,
+                   'from_date': from_date, 'to_date': to_date} for station, channel, from_date in gaps]
+    return files, calls, to_date
+
+
+def update(monitors, year=None, concurrency=None):
+    """
+    Updates the yearly files of monitors, with the gap queries of all of them run as one batch.
+
+    For a new file every station with the monitor whose activity window overlaps the year
+    (year_stations) is queried from January 1, and gets a column if it has valid data. The watermarks are
+    used and moved for the current year only, a past year is updated up to its last day from
+    the last value of each column.
+
+    Inputs:
+        monitors (list): Monitor names, keys of MONITORS, e.g. ['TDmin', 'TDmax'].
+        year (int or str): Year of the files. Default is the current year.
+        concurrency (int): Number of API requests in flight, see fetch.py. Default is None
+                           (IMS_CONCURRENCY or 8).
+
+    Outputs:
+        dict: Monitor -> its updated yearly frame, as written.
+    """
+    year = int(year or datetime.now().year)
+    current = year == datetime.now().year
+    marks = Watermarks()
+    planned, calls, to_date = plan_update(monitors, year, marks)
+    files = {}
+    for monitor, (opcsv, df, columns, new) in planned.items():
+        if os.path.exists(opcsv):
+            print(f"Updating {monitor} {year} incrementally...")
+        else:
+            print(f"Creating new file for {monitor} {year}...")
+        files[monitor] = (opcsv, df, columns, new, {})  # new hours, binned gaps
+    created = [monitor for monitor, (opcsv, _, _, _) in planned.items() if not os.path.exists(opcsv)]
+    print(f"{len(calls)} gaps to query for {', '.join(monitors)}")
+
+    # every record is binned into the hours of its file's update as it arrives
+    t1 = time.time()
+    seen = {}
+    with FetchEngine(concurrency=concurrency) as engine:
+        for count, (call, data) in enumerate(engine.map(query_unit, calls), 1):
+            monitor, station = call['monitor'], call['station']
+            if data is None:
+                msg = f'None data for {station} {monitor}!'
+                print(f'\r{msg:<80}')
+                continue
+            if data.last and data.last > seen.get(station, ''):
+                seen[station] = data.last
+            if current:
+                marks.advance(station, monitor, to_date)
+            new, binned = files[monitor][3:]
+            if not AGGREGATIONS[MONITORS[monitor]](new, 'x', data):
+                continue
+            binned[station] = new.pop('x').to_numpy()
+            t2 = time.time()
+            msg = f'updated {monitor} for {station} from {call["from_date"]} {t2 - t1:.2f}s ({count}/{len(calls)})'
+            print(f'\r{msg:<80}', end='', flush=True)
+            t1 = t2
+    print()
+
+    frames = {}
+    for monitor, (opcsv, before, columns, new, binned) in files.items():
+        df = before
+        if monitor in created:
+            # as the collectors, a new file has columns for the stations with valid data only
+            columns = [sta for sta in columns if sta in binned]
+        if len(new) > 0:
+            df_new = pd.concat([new, pd.DataFrame(binned, index=new.index)], axis=1)
+            df = upsert(before, df_new, columns)
+        print(f"Saving updated {monitor} data to {opcsv}")
+        written = write_year(opcsv, df)
+        print(f"{written} lines rewritten")
+        if written > 0 and len(new) > 0:
+            # the seasonal summaries take the new hours only
+            for name in update_seasons(file_prefix(monitor), before, df, new['datetime'].iloc[0]):
+                print(f"Updated data/{name}.csv")
+        frames[monitor] = df
+    note_activity(seen)
+    marks.save()  # only once the data is saved
+    get_client().costs.save()
+    return frames
+
+
+def check_new_files(monitors, year=None):
+    """
+    Plans the yearly files of monitors as new files, as on January 1, and compares their columns
+    with the previous year's files.
+
+    Outputs:
+        dict: Monitor -> stations of the previous year's file the new file wouldn't have, for the
+              monitors that miss any. Stations last seen before the year are not counted, the
+              collectors skip them too.
+    """
+    year = int(year or datetime.now().year)
+    to_date = min(datetime.now().strftime('%Y-%m-%d'), f'{year}-12-31')
+    df_act = pd.read_csv('data/ims_activity.csv')
+    retired = set(df_act['name'][df_act['latest'].fillna('') < f'{year}-01-01']) if year < 2026 else set()
+    missing = {}
+    for monitor in monitors:
+        previous = f'data/{file_prefix(monitor)}_{year - 1}.csv'
+        if not os.path.exists(previous):
+            continue
+        _, columns, _ = plan_new_file(monitor, year, to_date)
+        lost = [sta for sta in pd.read_csv(previous, nrows=0).columns[1:]
+                if sta not in columns and sta not in retired]
+        if lost:
+            missing[monitor] = lost
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Update the yearly hourly files of monitors incrementally.')
+    parser.add_argument('monitors', nargs='+', help=f"monitor names: {', '.join(MONITORS)}")
+    parser.add_argument('--year', type=int, default=None, help='year of the files, default the current year')
+    parser.add_argument('--workers', type=int, default=None, help='requests in flight (IMS_CONCURRENCY or 8)')
+    parser.add_argument('--check', action='store_true',
+                        help="check that new files of the year would keep the previous year's columns")
+    args = parser.parse_args()
+    if args.check:
+        year = args.year or datetime.now().year
+        missing = check_new_files(args.monitors, year=year)
+        for monitor, lost in missing.items():
+            print(f"{monitor}: a new {year} file would miss {len(lost)} stations of {year - 1}: {', '.join(lost)}")
+        if not missing:
+            print(f"new {year} files keep the {year - 1} columns")
+        sys.exit(1 if missing else 0)
+    update(args.monitors, year=args.year, concurrency=args.workers)
+    print(f'IMS API: {get_client().report()}')
+
+
+if __name__ == '__main__':
+    main()
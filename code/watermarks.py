@@ -0,0 +1,96 @@
+"""
+watermarks.py
+
+Per (station, monitor) watermark of how far the API has been queried, kept in
+data/watermarks.csv:
+
+    station,monitor,queried
+    AVNE ETAN,Rain,2026-10-18 18:40
+    AVNE ETAN,TDmax,2026-10-18 18:40
+
+The update scripts used to restart every station at its last non-NaN hour, so a station that
+had no rain since January was queried from January 1 on every run. A watermark records the
+last time that was *queried* successfully, whatever the values were, so the next gap starts
+at the watermark's day and a daily update costs one or two days per station. IMS publishes
+records with some delay, so a query marks the data only up to an hour before it ran.
+
+Usage:
+    marks = Watermarks()
+    from_date = marks.start('AVNE ETAN', 'Rain', default='2026-01-01')
+    rain_1h(stations=['AVNE ETAN'], from_date=from_date, to_date=today, watermarks=marks)
+    ...                                  # save the data first
+    marks.save()
+"""
+import os
+import csv
+import io
+from datetime import datetime, timedelta
+from cache import _write_atomic
+
+WATERMARKS_CSV = 'data/watermarks.csv'
+# records of the last hour may not be published yet when a query runs
+LAG = timedelta(hours=1)
+
+
+class Watermarks:
+    """
+    Inputs:
+        path (str): Watermarks CSV. Default is data/watermarks.csv.
+    """
+    def __init__(self, path=WATERMARKS_CSV):
+        self.path = path
+        self.marks = {}  # (station, monitor) -> 'YYYY-MM-DD HH:MM'
+        if os.path.exists(path):
+            with open(path, newline='', encoding='utf8') as f:
+                for row in csv.DictReader(f):
+                    self.marks[(row['station'], row['monitor'])] = row['queried']
+        self.changed = False
+
+    def get(self, station, monitor):
+        """
+        Outputs:
+            str or None: Time up to which the station's monitor was queried, 'YYYY-MM-DD HH:MM'.
+        """
+        return self.marks.get((station, monitor))
+
+    def start(self, station, monitor, default=None):
+        """
+        Outputs:
+            str: First date 'YYYY-MM-DD' still to query: the watermark's day, or the next day if
+                 the watermark closes its day. default if there is no watermark.
+        """
+        mark = self.get(station, monitor)
+        if mark is None:
+            return default
+        return (datetime.strptime(mark, '%Y-%m-%d %H:%M') + timedelta(minutes=1)).strftime('%Y-%m-%d')
+
+    def advance(self, station, monitor, to_date, now=None):
+        """
+        Records a successful query up to to_date (inclusive). Never moves a watermark back.
+
+        Inputs:
+            station (str): Station name.
+            monitor (str): Monitor name, e.g. 'Rain', 'TDmax', 'RH'.
+            to_date (str): Last date of the query, 'YYYY-MM-DD'.
+            now (datetime): Time of the query. Default is now.
+        """
+        now = (now or datetime.now()) - LAG
+        mark = min(f'{to_date} 23:59', now.strftime('%Y-%m-%d %H:%M'))
+        key = (station, monitor)
+        if key not in self.marks or mark > self.marks[key]:
+            self.marks[key] = mark
+            self.changed = True
+
+    def save(self):
+        """
+        Writes the CSV if any watermark moved.
+        """
+        if not self.changed:
+            return
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(['station', 'monitor', 'queried'])
+        for (station, monitor), mark in sorted(self.marks.items()):
+            writer.writerow([station, monitor, mark])
+        _write_atomic(self.path, out.getvalue().encode('utf8'))
+        self.changed = False
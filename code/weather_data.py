@@ -0,0 +1,329 @@
+"""
+weather_data.py
+
+Pure data utilities shared by the collectors (weather.py) and the file scripts: hourly axes,
+binning of API records into hourly columns, merging new hours into a yearly frame, CSV
+rounding and smoothing.
+
+Importing this module touches neither the filesystem nor the environment and doesn't load
+pandas or requests, so scripts that only need e.g. round_data start fast.
+"""
+import os
+import io
+import re
+import math
+import itertools
+import tempfile
+import numpy as np
+from datetime import datetime, timedelta
+from records import Records
+
+
+def hour_vector(from_date, to_date):
+    """
+    Generates a list of hourly timestamps between two dates.
+    
+    Inputs:
+        from_date (str): Start date in 'YYYY-MM-DD' format
+        to_date (str): End date in 'YYYY-MM-DD' format
+    
+    Outputs:
+        list: List of datetime strings in 'YYYY-MM-DD HH:MM' format for each hour 
+             between from_date and to_date (inclusive)
+    """
+    date_format = "%Y-%m-%d"
+    start_date = datetime.strptime(from_date, date_format)
+    end_date = datetime.strptime(to_date, date_format)
+    delta = end_date - start_date
+    hours = []
+    for i in range(delta.days + 1):
+        day = start_date + timedelta(days=i)
+        for h in range(24):
+            hours.append((day + timedelta(hours=h)).strftime("%Y-%m-%d %H:%M"))
+    return hours
+
+
+def hour_rows(df, stamps):
+    """
+    Maps records to rows of an hourly frame, by the hour each record falls in.
+
+    Inputs:
+        df (pandas.DataFrame): Hourly frame with a sorted 'datetime' column ('YYYY-MM-DD HH:00').
+        stamps (numpy.ndarray): datetime64[h] of every record, see valid_values.
+
+    Outputs:
+        (numpy.ndarray, numpy.ndarray): Row of every record, and a mask of records that fall
+                                        inside the frame (rows of the others are meaningless).
+    """
+    hours = np.array([t[:13].replace(' ', 'T') for t in df['datetime'].values], dtype='datetime64[h]')
+    rows = np.searchsorted(hours, stamps)
+    inside = rows < len(hours)
+    inside[inside] = hours[rows[inside]] == stamps[inside]
+    return rows, inside
+
+
+def valid_values(data, positive=False):
+    """
+    Valid records (valid flag set and status 1) of one channel.
+
+    Inputs:
+        data (list or Records): Records of one channel as returned by the query functions,
+                                either the raw list or already filtered (streamed, see records.py).
+        positive (bool): Keep only values > 0 (rain). Default is False.
+
+    Outputs:
+        (numpy.ndarray, numpy.ndarray): datetime64[h] hour and float64 value of every valid record.
+    """
+    if isinstance(data, Records):
+        stamps, values = data.hours, data.values
+    else:
+        data = [d for d in data if d['channels'][0]['valid'] == True and d['channels'][0]['status'] == 1
+                and d['channels'][0]['value'] is not None]
+        stamps = np.array([d['datetime'][:13] for d in data], dtype='datetime64[h]')
+        values = np.array([d['channels'][0]['value'] for d in data], dtype=float)
+    if positive:
+        wet = values > 0
+        stamps, values = stamps[wet], values[wet]
+    return stamps, values
+
+
+def add_rain_column(df_rain, station, data):
+    """
+    Sums valid positive rain records of one station into hourly bins, as a new column of df_rain.
+    Records outside the frame's hours are dropped.
+
+    Inputs:
+        df_rain (pandas.DataFrame): Hourly frame with a 'datetime' column, modified in place.
+        station (str): Station name, used as column name.
+        data (list or Records): Records of one channel as returned by query_rain.
+
+    Outputs:
+        bool: True if a column was added, False if there was no valid rain.
+    """
+    stamps, values = valid_values(data, positive=True)
+    if len(values) == 0:
+        return False
+    rows, inside = hour_rows(df_rain, stamps)
+    rows = rows[inside]
+    # scatter-add in record order, so the sums match adding the records one by one
+    total = np.zeros(len(df_rain))
+    np.add.at(total, rows, np.round(values[inside], 1))
+    column = np.full(len(df_rain), np.nan)
+    wet = np.bincount(rows, minlength=len(df_rain)) > 0
+    column[wet] = total[wet]
+    df_rain[station] = column
+    return True
+
+
+def add_temp_column(df_temp, station, data, monitor):
+    """
+    Keeps the hourly minimum (TDmin) or maximum (TDmax) of valid records of one station,
+    as a new column of df_temp.
+
+    Inputs:
+        df_temp (pandas.DataFrame): Hourly frame with a 'datetime' column, modified in place.
+        station (str): Station name, used as column name.
+        data (list or Records): Records of one channel as returned by query_temp.
+        monitor (str): 'TDmin' or 'TDmax'.
+
+    Outputs:
+        bool: True if a column was added, False if there was no valid data.
+    """
+    stamps, values = valid_values(data)
+    if len(values) == 0:
+        return False
+    rows, inside = hour_rows(df_temp, stamps)
+    column = np.full(len(df_temp), np.nan)
+    # fmin/fmax ignore the initial NaN, so the first record of an hour is taken as is
+    reduce = np.fmin if monitor == 'TDmin' else np.fmax
+    reduce.at(column, rows[inside], np.round(values[inside], 1))
+    df_temp[station] = column
+    return True
+
+
+def add_mean_column(df_out, station, data):
+    """
+    Averages valid records of one station within each hour, as a new column of df_out.
+
+    Inputs:
+        df_out (pandas.DataFrame): Hourly frame with a 'datetime' column, modified in place.
+        station (str): Station name, used as column name.
+        data (list or Records): Records of one channel as returned by query_monitor.
+
+    Outputs:
+        bool: True if a column was added, False if there was no valid data.
+    """
+    stamps, values = valid_values(data)
+    if len(values) == 0:
+        return False
+    rows, inside = hour_rows(df_out, stamps)
+    rows, values = rows[inside], values[inside]
+    column = np.full(len(df_out), np.nan)
+    # sort records by hour (keeping their order within the hour), then reduce all hours with
+    # the same number of records as rows of one 2D array: numpy sums each row the same way
+    # np.mean sums a list, so the rounded means don't depend on the binning method
+    order = np.argsort(rows, kind='stable')
+    rows, values = rows[order], values[order]
+    hours, start, count = np.unique(rows, return_index=True, return_counts=True)
+    for n in np.unique(count):
+        same = count == n
+        block = values[start[same][:, None] + np.arange(n)]
+        column[hours[same]] = np.round(np.add.reduce(block, axis=1) / n, 2)
+    df_out[station] = column
+    return True
+
+
+def upsert(df, df_new, stations):
+    """
+    Merges newly collected hours into a frame, aligned on datetime, in bulk.
+
+    Inputs:
+        df (pandas.DataFrame): Hourly frame with a 'datetime' column, e.g. a yearly CSV.
+        df_new (pandas.DataFrame): New hours in the same layout, e.g. from rain_1h(save_csv=False).
+        stations (list): Station columns to take from df_new. Stations df doesn't have are
+                         added, in this order, NaN where df_new has no value.
+
+    Outputs:
+        pandas.DataFrame: df with the datetimes of df_new it lacks added in datetime order and
+                          the non-NaN values of df_new's stations replacing df's.
+    """
+    import pandas as pd  # only needed here, keeps the module import light
+    merged = df.set_index('datetime')
+    new = df_new.set_index('datetime')
+    missing = new.index.difference(merged.index)
+    if len(missing) > 0:
+        merged = merged.reindex(merged.index.append(missing)).sort_index(kind='stable')
+    added = [sta for sta in stations if sta not in merged.columns]
+    if added:
+        merged = pd.concat([merged, pd.DataFrame(np.nan, index=merged.index, columns=added)], axis=1)
+    taken = [sta for sta in stations if sta in new.columns]
+    if taken:
+        merged.update(new[taken])
+        merged = merged.copy()  # update sets column by column, join the blocks again
+    merged.index.name = 'datetime'
+    return merged.reset_index()
+
+
+def round_text(text):
+    """
+    Rounds all floats with 2+ decimal places in CSV text to 1 decimal place.
+    Uses proper mathematical rounding (not truncation).
+    """
+    def round_match(match):
+        """Replacement function that properly rounds the float."""
+        num_str = match.group(0)
+        rounded = round(float(num_str), 1)
+        return f'{rounded:.1f}'
+    return re.sub(r'\d+\.\d{2,}', round_match, text)
+
+
+def _add_sums(sums, header, text):
+    # adds the exact (fsum) per-column sums of CSV rows, first column excluded, to sums
+    import pandas as pd  # only needed here, keeps the module import light
+    values = pd.read_csv(io.StringIO(header + text)).iloc[:, 1:].to_numpy(dtype=float)
+    if not sums:
+        sums.extend([] for _ in range(values.shape[1]))
+    for col in range(values.shape[1]):
+        column = values[:, col]
+        sums[col].append(math.fsum(column[~np.isnan(column)]))
+
+
+def round_data(file, chunk_lines=50000):
+    """
+    Rounds all floats in a CSV file to 1 decimal place using text manipulation.
+    Uses proper mathematical rounding (not truncation).
+
+    The file is read once, in chunks of lines: each chunk is rounded, written to a temp file
+    next to the file and its per-column sums before and after rounding are added up. The temp
+    file replaces the file only if the sums, rounded to 1 decimal, all match.
+
+    Inputs:
+        file (str): CSV file, a label or datetime column first.
+        chunk_lines (int): Lines per chunk, bounds the memory used. Default is 50000.
+
+    Outputs:
+        bool: True if the file was rounded, False if the sums didn't match.
+    """
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(file) + '.', suffix='.tmp',
+                               dir=os.path.dirname(os.path.abspath(file)))
+    try:
+        with open(file, 'r') as src, os.fdopen(fd, 'w') as dst:
+            header = src.readline()
+            dst.write(round_text(header))
+            sums0, sums1 = [], []
+            while True:
+                text = ''.join(itertools.islice(src, chunk_lines))
+                if not text:
+                    break
+                # Match floats with 2+ decimal places and round them properly
+                rounded = round_text(text)
+                dst.write(rounded)
+                # Calculate sums before and after rounding
+                _add_sums(sums0, header, text)
+                _add_sums(sums1, header, rounded)
+        sums0 = np.round([math.fsum(parts) for parts in sums0], 1)
+        sums1 = np.round([math.fsum(parts) for parts in sums1], 1)
+        if np.all(sums0 == sums1):
+            os.chmod(tmp, os.stat(file).st_mode & 0o777)
+            os.replace(tmp, file)
+            return True
+        print('Sums do not match, file not overwritten')
+        return False
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def round_files(files, workers=None):
+    """
+    Rounds many CSV files with round_data, in parallel processes.
+
+    Inputs:
+        files (list): CSV files.
+        workers (int): Processes. Default is the number of CPUs.
+
+    Outputs:
+        dict: file -> True if it was rounded, False if its sums didn't match.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    files = list(files)
+    if len(files) <= 1 or workers == 1:
+        return {file: round_data(file) for file in files}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(files, executor.map(round_data, files)))
+
+
+def split_channels(data, monitor):
+    """
+    Picks one monitor out of an all-channels payload, in the layout of a single channel query.
+
+    Inputs:
+        data (list): Records as returned by query_station.
+        monitor (str): Channel name (e.g. 'Rain', 'TDmin').
+
+    Outputs:
+        list: Records with a single item in 'channels', only for records that have the monitor.
+    """
+    records = []
+    for d in data:
+        for channel in d['channels']:
+            if channel['name'] == monitor:
+                records.append({'datetime': d['datetime'], 'channels': [channel]})
+                break
+    return records
+
+
+def smooth(vector, window=24*6, method='conv'):
+    offset =np.ceil(window/2) - 1
+    vector[np.isnan(vector)] = 0
+    if method == 'conv':
+        smoothed = np.convolve(vector, np.ones(window)/window, mode='same')
+    elif method == 'sum':
+        smoothed = vector.copy()
+        for ii in range(int(offset), len(vector) - int(window-offset)):
+            smoothed[ii] = np.sum(vector[ii-int(offset):ii+int(offset)+1])
+    else:
+        smoothed = vector.copy()
+        for ii in range(offset, len(vector) - (window-offset)):
+            smoothed[ii] = np.mean(vector[ii-offset:ii+offset+1])
+    return smoothed